@@ -0,0 +1,219 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# Benchmark of the HTTP client against a local stand-in of the Discord REST API, no network access is needed.
+# Usage: python -m benchmarks.http [requests] [concurrency]
+
+import asyncio
+import dataclasses
+import json
+import logging
+import math
+import socket
+import statistics
+import struct
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from aiohttp import web
+from interactions.api.http.route import Route
+from interactions.client.errors import HTTPException
+
+from src.core import ModifiedHTTPClient
+from src.utils import Ratelimited
+
+CHANNELS = 10
+
+
+@dataclasses.dataclass
+class Scenario:
+    """
+    How the stand-in server behaves.
+    """
+
+    name: str
+    bucket_limit: int = 1000  # requests per window of every channel
+    bucket_window: float = 1  # seconds
+    global_limit: int = 1000  # requests per second
+    error_period: int = 0  # a burst of 5xx responses starts every this many requests
+    error_burst: int = 0  # responses in a burst
+    reset_period: int = 0  # every this many requests the connection is reset
+
+
+SCENARIOS = [
+    Scenario("clean"),
+    Scenario("bucket limits", bucket_limit=5),
+    Scenario("global limit", global_limit=40),
+    Scenario("5xx bursts", error_period=50, error_burst=3),
+    Scenario("connection resets", reset_period=25),
+]
+
+
+class StandIn:
+    """
+    A local server answering the channel routes like Discord does, including the rate limit headers and 429 bodies.
+    """
+
+    def __init__(self, scenario: Scenario) -> None:
+        self.scenario = scenario
+        self.counters: Counter[str] = Counter()
+        self.buckets: Dict[Tuple[str, str], List[float]] = {}  # (route, channel) -> [reset at, remaining]
+        self.global_window = [0.0, 0]  # [reset at, remaining]
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api/v10/users/@me", self.me)
+        app.router.add_route("*", "/api/v10/channels/{channel_id}", self.channel)
+        return app
+
+    async def me(self, _request: web.Request) -> web.Response:
+        return self.json({"id": "1", "username": "benchmark"})
+
+    @staticmethod
+    def json(data: dict, status: int = 200, headers: Dict[str, str] = None) -> web.Response:
+        # Discord sends the content type without a charset, which is what the client checks for
+        return web.Response(
+            body=json.dumps(data).encode(),
+            status=status,
+            headers={**(headers or {}), "Content-Type": "application/json"},
+        )
+
+    @staticmethod
+    def reset(request: web.Request) -> web.Response:
+        # closing with a zero linger time sends a RST, the client sees ECONNRESET
+        sock = request.transport.get_extra_info("socket")
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        request.transport.close()
+        return web.Response()
+
+    async def channel(self, request: web.Request) -> web.Response:
+        scenario = self.scenario
+        self.counters["requests"] += 1
+        n = self.counters["requests"]
+        if scenario.reset_period and n % scenario.reset_period == 0:
+            self.counters["resets"] += 1
+            return self.reset(request)
+        if scenario.error_period and n % scenario.error_period < scenario.error_burst:
+            self.counters["5xx"] += 1
+            return self.json({"message": "502: Bad Gateway", "code": 0}, 502)
+
+        now = time.monotonic()
+        if self.global_window[0] <= now:
+            self.global_window = [now + 1, scenario.global_limit]
+        if self.global_window[1] <= 0:
+            self.counters["global 429"] += 1
+            retry_after = self.global_window[0] - now
+            return self.json(
+                {"message": "You are being rate limited.", "retry_after": retry_after, "global": True},
+                429,
+                {
+                    "Retry-After": str(math.ceil(retry_after)),
+                    "X-RateLimit-Global": "true",
+                    "X-RateLimit-Scope": "global",
+                },
+            )
+        self.global_window[1] -= 1
+
+        key = (request.method, request.match_info["channel_id"])
+        bucket = self.buckets.get(key)
+        if bucket is None or bucket[0] <= now:
+            bucket = self.buckets[key] = [now + scenario.bucket_window, scenario.bucket_limit]
+        headers = {
+            "X-RateLimit-Bucket": f"{request.method.lower()}-channel",
+            "X-RateLimit-Limit": str(scenario.bucket_limit),
+            "X-RateLimit-Remaining": str(max(int(bucket[1]) - 1, 0)),
+            "X-RateLimit-Reset-After": f"{bucket[0] - now:.3f}",
+        }
+        if bucket[1] <= 0:
+            self.counters["bucket 429"] += 1
+            retry_after = bucket[0] - now
+            headers["Retry-After"] = str(math.ceil(retry_after))
+            headers["X-RateLimit-Scope"] = "user"
+            return self.json(
+                {"message": "You are being rate limited.", "retry_after": retry_after, "global": False}, 429, headers
+            )
+        bucket[1] -= 1
+        await asyncio.sleep(0.005)  # roughly the time Discord takes to answer
+        return self.json({"id": request.match_info["channel_id"], "type": 2, "name": "benchmark"}, headers=headers)
+
+
+async def run(scenario: Scenario, skip_ratelimit: bool, requests: int, concurrency: int) -> None:
+    server = StandIn(scenario)
+    runner = web.AppRunner(server.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    Route.BASE = f"http://127.0.0.1:{port}/api/v10"
+
+    logger = logging.getLogger("benchmark")
+    logger.setLevel(logging.CRITICAL)
+    http = ModifiedHTTPClient(logger=logger)
+    await http.login("benchmark")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    outcomes: Counter[str] = Counter()
+
+    async def send(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                if skip_ratelimit:
+                    await http.modify_channel_raise(i % CHANNELS, {"name": str(i)})
+                else:
+                    await http.modify_channel(i % CHANNELS, {"name": str(i)})
+            except Ratelimited:
+                outcomes["ratelimited"] += 1
+            except HTTPException:
+                outcomes["failed"] += 1
+            except OSError:
+                outcomes["failed"] += 1
+            else:
+                outcomes["ok"] += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    await http.close()
+    await runner.cleanup()
+
+    p50, p95, p99 = (statistics.quantiles(latencies, n=100)[i] * 1000 for i in (49, 94, 98))
+    print(
+        f"{scenario.name:<18} {'raise' if skip_ratelimit else 'wait':<5} {requests / elapsed:7.1f} req/s"
+        f" | p50 {p50:7.1f} p95 {p95:7.1f} p99 {p99:7.1f} ms"
+        f" | ok {outcomes['ok']:>4} limited {outcomes['ratelimited']:>4} failed {outcomes['failed']:>4}"
+        f" | sent {server.counters['requests']:>4} retries {http.retry.retries:>3}"
+        f" predicted {http.predictor.predicted:>4}"
+        f" | 429 {server.counters['bucket 429']}/{server.counters['global 429']}"
+        f" 5xx {server.counters['5xx']} resets {server.counters['resets']}"
+    )
+
+
+async def main(requests: int = 200, concurrency: int = 20) -> None:
+    print(f"{requests} requests over {CHANNELS} channels, {concurrency} in flight")
+    print("wait: the rate limited path, raise: skip_ratelimit, 429: bucket/global, retries: raise path only")
+    for scenario in SCENARIOS:
+        for skip_ratelimit in (False, True):
+            await run(scenario, skip_ratelimit, requests, concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*map(int, sys.argv[1:])))
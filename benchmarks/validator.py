@@ -0,0 +1,63 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+# Benchmark of scanning messages for URLs and tokens.
+# Usage: python -m benchmarks.validator [iterations]
+
+import sys
+import timeit
+
+from src.utils.validator import Validator
+
+TOKEN = "MTIzNDU2Nzg5MDEyMzQ1Njc4.GaBcDe.abcdefghijklmnopqrstuvwxyz0123"
+
+# (weight, message), the weights roughly follow how often each shape is seen in a busy guild
+CORPUS = [
+    (30, "早安"),
+    (20, "lol"),
+    (20, "有人要一起打遊戲嗎？我等等八點上線"),
+    (15, "<@123456789012345678> 你看一下這個 <:pepe:1252488534619852821>"),
+    (10, "ok... 那就這樣吧... 明天見"),
+    (8, "https://tenor.com/view/cat-dance-gif-1234567890"),
+    (6, "看這個 https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=42s 超好笑"),
+    (4, "```py\nimport asyncio\n\nasync def main():\n    await asyncio.sleep(1.5)\n\nasyncio.run(main())\n```"),
+    (3, "I think the problem is in the config. Try setting level to DEBUG. Then restart the bot. " * 3),
+    (2, "https://discord.com/channels/123456789012345678/123456789012345678/123456789012345678"),
+    (1, f"bot.run('{TOKEN}')"),
+    (1, f"https://example.com/callback?token={TOKEN}"),
+]
+
+
+def separate(text: str) -> None:
+    Validator.find_tokens(text)
+    Validator.find_urls(text)
+
+
+def single(text: str) -> None:
+    Validator.scan(text)
+
+
+def main(iterations: int = 2000) -> None:
+    messages = [message for weight, message in CORPUS for _ in range(weight)]
+    print(f"{len(messages)} messages x {iterations} iterations")
+    for name, func in (("separate regex scans", separate), ("single-pass scan", single)):
+        elapsed = timeit.timeit(lambda f=func: [f(i) for i in messages], number=iterations)
+        print(f"{name:<22} {elapsed / iterations / len(messages) * 1e9:8.0f} ns/message")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -15,6 +15,7 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+from .bulk import BulkOperations, ChannelDeleteJob
 from .config import Config
 from .database import (
     DatabaseClient,
@@ -23,8 +24,13 @@ from .database import (
     to_bigint,
     to_snowflake,
 )
+from .edits import ChannelEditQueue
 from .http import ModifiedHTTPClient
 from .logging import InterceptHandler, Logger
+from .metrics import HTTPMetrics
+from .priority import Priority, RequestScheduler, request_priority
+from .ratelimit import RateLimitPredictor
+from .retry import RetryPolicy
 
 __all__ = (
     "Config",
@@ -36,4 +42,13 @@ __all__ = (
     "DvcSettingsModel",
     "SafetySettingsModel",
     "ModifiedHTTPClient",
+    "BulkOperations",
+    "ChannelDeleteJob",
+    "ChannelEditQueue",
+    "RateLimitPredictor",
+    "RetryPolicy",
+    "HTTPMetrics",
+    "Priority",
+    "RequestScheduler",
+    "request_priority",
 )
@@ -0,0 +1,189 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import itertools
+import time
+from typing import (
+    TYPE_CHECKING,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Optional,
+)
+
+from interactions.api.http.route import Route
+from interactions.client.errors import DiscordError, HTTPException, NotFound
+
+from .priority import Priority, request_priority
+
+if TYPE_CHECKING:
+    from .http import ModifiedHTTPClient
+
+__all__ = ("BulkOperations", "ChannelDeleteJob")
+
+
+class ChannelDeleteJob:
+    """
+    A background job deleting many channels.
+    The requests go through the rate limited path of the HTTP client, so the route buckets and the global limit are
+    respected while a few requests are kept in flight. Server errors are retried with the retry policy of the client.
+    The requests have the background priority, so they give way to interactions and user-visible requests.
+    """
+
+    def __init__(
+        self,
+        http: "ModifiedHTTPClient",
+        channel_ids: Iterable[int],
+        reason: Optional[str] = None,
+        concurrency: int = 5,
+        on_deleted: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> None:
+        """
+        Initialize the job.
+
+        :param http: The HTTP client.
+        :type http: ModifiedHTTPClient
+        :param channel_ids: The IDs of the channels to delete.
+        :type channel_ids: Iterable[int]
+        :param reason: The audit log reason.
+        :type reason: Optional[str]
+        :param concurrency: The maximum number of requests in flight.
+        :type concurrency: int
+        :param on_deleted: Called with the ID of every channel that was deleted or no longer exists.
+        :type on_deleted: Optional[Callable[[int], Awaitable[None]]]
+        """
+        self.http = http
+        self.channel_ids = list(dict.fromkeys(channel_ids))
+        self.reason = reason
+        self.on_deleted = on_deleted
+        self.deleted = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.task = asyncio.create_task(self._run())
+
+    @property
+    def total(self) -> int:
+        """
+        The number of channels to delete.
+        """
+        return len(self.channel_ids)
+
+    @property
+    def finished(self) -> bool:
+        """
+        Whether the job has finished.
+        """
+        return self.task.done()
+
+    async def _run(self) -> None:
+        with request_priority(Priority.BACKGROUND):
+            results = await asyncio.gather(*(self._delete(i) for i in self.channel_ids), return_exceptions=True)
+        for channel_id, result in zip(self.channel_ids, results):
+            if isinstance(result, Exception):
+                self.failed += 1
+                self.http.logger.error(f"Failed to delete channel {channel_id}: {result!r}")
+
+    async def _delete(self, channel_id: int) -> None:
+        async with self._semaphore:
+            started_at = time.monotonic()
+            for attempt in itertools.count():
+                try:
+                    result = await self.http.request(
+                        Route("DELETE", "/channels/{channel_id}", channel_id=channel_id), reason=self.reason
+                    )
+                except NotFound:
+                    break
+                except (DiscordError, OSError):
+                    result = None
+                except HTTPException:
+                    self.failed += 1
+                    return
+                # the client returns None instead of raising once it gives up on server errors
+                if result is not None:
+                    break
+                if (delay := self.http.retry.backoff(attempt, started_at)) is None:
+                    self.failed += 1
+                    return
+                await asyncio.sleep(delay)
+            if self.on_deleted:
+                await self.on_deleted(channel_id)
+            self.deleted += 1
+
+
+class BulkOperations:
+    """
+    Keeps track of the bulk jobs, at most one job runs per key.
+    """
+
+    def __init__(self, http: "ModifiedHTTPClient", concurrency: int = 5) -> None:
+        """
+        Initialize the bulk operations.
+
+        :param http: The HTTP client.
+        :type http: ModifiedHTTPClient
+        :param concurrency: The maximum number of requests in flight per job.
+        :type concurrency: int
+        """
+        self.http = http
+        self.concurrency = concurrency
+        self.jobs: Dict[Hashable, ChannelDeleteJob] = {}
+
+    def get(self, key: Hashable) -> Optional[ChannelDeleteJob]:
+        """
+        Get the running job of a key.
+
+        :param key: The key of the job.
+        :type key: Hashable
+
+        :return: The job, or None if there is no running job.
+        :rtype: Optional[ChannelDeleteJob]
+        """
+        if (job := self.jobs.get(key)) is not None and job.finished:
+            del self.jobs[key]
+            return None
+        return job
+
+    def delete_channels(
+        self,
+        key: Hashable,
+        channel_ids: Iterable[int],
+        reason: Optional[str] = None,
+        on_deleted: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> ChannelDeleteJob:
+        """
+        Delete channels in the background.
+        If a job with the same key is still running, that job is returned instead.
+
+        :param key: The key of the job, e.g. the feature and guild ID.
+        :type key: Hashable
+        :param channel_ids: The IDs of the channels to delete.
+        :type channel_ids: Iterable[int]
+        :param reason: The audit log reason.
+        :type reason: Optional[str]
+        :param on_deleted: Called with the ID of every channel that was deleted or no longer exists.
+        :type on_deleted: Optional[Callable[[int], Awaitable[None]]]
+
+        :return: The job.
+        :rtype: ChannelDeleteJob
+        """
+        if (job := self.get(key)) is None:
+            job = self.jobs[key] = ChannelDeleteJob(self.http, channel_ids, reason, self.concurrency, on_deleted)
+        return job
@@ -16,10 +16,21 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import asyncio
-from typing import List, Optional
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
 
-from scyllapy import Consistency, ExecutionProfile, Scylla
+from scyllapy import (
+    Batch,
+    Consistency,
+    ExecutionProfile,
+    PreparedQuery,
+    Query,
+    QueryResult,
+    Scylla,
+)
+from scyllapy.exceptions import ScyllaPyDBError
 
+from .cache import TTLCache
 from .features import (
     Counting,
     CountingSettingsModel,
@@ -28,12 +39,20 @@ from .features import (
     Safety,
     SafetySettingsModel,
 )
+from .migrations import Migration, MigrationEngine, SchemaAgreementError
+from .profiles import build_profiles
+from .registry import DvcRegistry
+from .singleflight import SingleFlight
 from .utils import to_bigint, to_snowflake
 
 __all__ = (
     "DatabaseClient",
     "to_bigint",
     "to_snowflake",
+    "TTLCache",
+    "Migration",
+    "SchemaAgreementError",
+    "DvcRegistry",
     "DvcSettingsModel",
     "SafetySettingsModel",
     "CountingSettingsModel",
@@ -46,6 +65,7 @@ class DatabaseClient(Dvc, Safety, Counting):
     """
 
     _ready = asyncio.Event()
+    _initializing: ContextVar[bool] = ContextVar("initializing", default=False)
     _profile = ExecutionProfile(consistency=Consistency.QUORUM)
 
     def __init__(
@@ -54,7 +74,11 @@ class DatabaseClient(Dvc, Safety, Counting):
         username: Optional[str] = "",
         password: Optional[str] = "",
         keyspace: Optional[str] = "discord",
-        **kwargs
+        cache_size: Optional[int] = 4096,
+        cache_ttl: Optional[float] = 300,
+        schema_agreement_timeout: Optional[float] = 10,
+        profiles: Optional[Dict[str, Dict[str, Any]]] = None,
+        **kwargs,
     ) -> None:
         self.scylla = Scylla(
             contact_points=hosts,
@@ -62,30 +86,174 @@ class DatabaseClient(Dvc, Safety, Counting):
             password=password,
             keyspace=keyspace,
             default_execution_profile=self._profile,
-            **kwargs
+            **kwargs,
         )
+        self.profiles: Dict[str, ExecutionProfile] = build_profiles(profiles)
+        self._statements: Dict[str, Tuple[str, str]] = {}
+        self._prepared: Dict[str, PreparedQuery] = {}
+        self.settings_cache: TTLCache = TTLCache(cache_size, cache_ttl)
+        self.migration_engine = MigrationEngine(self, schema_agreement_timeout)
+        self.single_flight: SingleFlight = SingleFlight()
+        self.dvc_registry = DvcRegistry()
 
     async def wait_until_ready(self) -> None:
         """
         Waits until the database is ready.
+        Queries issued by the initialization itself (e.g. setup hooks) are not blocked.
         """
-        await self._ready.wait()
+        if not self._initializing.get():
+            await self._ready.wait()
 
-    async def initialize(self) -> None:
+    async def initialize(self) -> List[Migration]:
         """
         Initializes the database.
+        Pending schema migrations are applied and the schema is agreed on before the database is marked as ready.
+        The in-memory registries are loaded last.
+
+        :raises SchemaAgreementError: Raised when the nodes do not agree on the schema after a migration,
+            the database is then not marked as ready.
+
+        :return: The applied migrations.
+        :rtype: List[Migration]
         """
-        await self.scylla.startup()
-        await self.setup_queries()
+        token = self._initializing.set(True)
+        try:
+            await self.scylla.startup()
+            applied = await self.migrate()
+            await self.prepare_queries()
+            await self.load_dvc_registry()
+        finally:
+            self._initializing.reset(token)
         self._ready.set()
+        return applied
+
+    async def migrate(self, dry_run: bool = False) -> List[Migration]:
+        """
+        Applies the pending schema migrations of the features.
 
-    async def setup_queries(self) -> None:
+        :param dry_run: Whether to only report the pending migrations without applying them.
+        :type dry_run: bool
+
+        :return: The applied (or, in dry-run mode, pending) migrations.
+        :rtype: List[Migration]
         """
-        Sets up the queries.
+        applied = await self.migration_engine.run(dry_run)
+        if applied and not dry_run and self._prepared:
+            await self.prepare_queries()
+        return applied
+
+    async def prepare_queries(self) -> None:
         """
+        Prepares the statements declared by the features.
+        Call this again to re-prepare all statements after a schema change or a reconnect.
+
+        :raises ValueError: Raised when two features declare a statement with the same name,
+            or a statement uses an unknown execution profile.
+        """
+        statements = {}
         for cls in DatabaseClient.__bases__:
-            for query in getattr(cls, "setup_queries", []):
-                await self.scylla.execute(query)
+            for name, query in getattr(cls, "queries", {}).items():
+                if name in statements:
+                    raise ValueError(f"Duplicated statement name: {name}")
+                if query[1] not in self.profiles:
+                    raise ValueError(f"Unknown execution profile {query[1]} of statement {name}")
+                statements[name] = query
+        prepared = await asyncio.gather(
+            *(
+                self.scylla.prepare(Query(query, profile=self.profiles[profile]))
+                for query, profile in statements.values()
+            )
+        )
+        self._statements = statements
+        self._prepared = dict(zip(statements, prepared))
+
+    async def reprepare(self, name: str) -> PreparedQuery:
+        """
+        Re-prepares a single statement.
+
+        :param name: The name of the statement.
+        :type name: str
+
+        :return: The newly prepared statement.
+        :rtype: PreparedQuery
+        """
+        query, profile = self._statements[name]
+        self._prepared[name] = await self.scylla.prepare(Query(query, profile=self.profiles[profile]))
+        return self._prepared[name]
+
+    def prepared(self, name: str) -> PreparedQuery:
+        """
+        Get a cached prepared statement by its name.
+
+        :param name: The name of the statement.
+        :type name: str
+
+        :raises KeyError: Raised when no feature declares the statement.
+
+        :return: The prepared statement.
+        :rtype: PreparedQuery
+        """
+        return self._prepared[name]
+
+    async def execute_prepared(
+        self,
+        name: str,
+        params: Iterable[Any] | dict[str, Any] | None = None,
+        *,
+        paged: bool = False,
+    ) -> Union[QueryResult, Any]:
+        """
+        Executes a prepared statement by its name.
+        Concurrent identical reads share a single in-flight request.
+        """
+        await self.wait_until_ready()
+        if paged or not self._statements[name][0].lstrip().upper().startswith("SELECT"):
+            return await self._execute_prepared(name, params, paged)
+        return await self.single_flight.do(
+            self._flight_key(name, params), lambda: self._execute_prepared(name, params, paged)
+        )
+
+    @staticmethod
+    def _flight_key(name: str, params: Iterable[Any] | dict[str, Any] | None) -> Tuple[Any, ...]:
+        """
+        Get the single-flight key of a read, the values are part of the key so only identical reads are shared.
+        This is an internal method and should not be called directly.
+        """
+        if isinstance(params, Mapping):
+            return name, tuple(sorted((k, repr(v)) for k, v in params.items()))
+        return name, tuple(repr(i) for i in params or ())
+
+    async def _execute_prepared(
+        self,
+        name: str,
+        params: Iterable[Any] | dict[str, Any] | None,
+        paged: bool,
+    ) -> Union[QueryResult, Any]:
+        """
+        Executes a prepared statement by its name.
+        This is an internal method and should not be called directly.
+        The statement is re-prepared and executed again once if the server no longer knows about it.
+        """
+        try:
+            return await self.scylla.execute(self.prepared(name), params, paged=paged)
+        except ScyllaPyDBError as e:
+            if "prepared" not in str(e).lower():
+                raise
+        return await self.scylla.execute(await self.reprepare(name), params, paged=paged)
+
+    async def execute_batch(
+        self,
+        names: List[str],
+        params: List[Iterable[Any] | dict[str, Any]],
+    ) -> QueryResult:
+        """
+        Executes several prepared statements by their names as a single logged batch.
+        """
+        await self.wait_until_ready()
+        batch = Batch()
+        for name in names:
+            batch.add_query(self.prepared(name))
+        return await self.scylla.batch(batch, params)
 
     async def execute(self, *args, **kwargs) -> None:
         """
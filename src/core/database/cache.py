@@ -0,0 +1,118 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import copy
+import time
+from collections import OrderedDict
+from typing import Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+__all__ = ("TTLCache",)
+
+T = TypeVar("T")
+
+
+class TTLCache(Generic[T]):
+    """
+    A bounded LRU cache where every entry also expires after a fixed time.
+    Values are copied on the way in and out, so callers are free to mutate what they get back.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 300) -> None:
+        """
+        Initialize the cache.
+
+        :param maxsize: The maximum number of entries, the least recently used entry is evicted first.
+        :type maxsize: int
+        :param ttl: The time in seconds before an entry expires.
+        :type ttl: float
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, Tuple[float, T]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[T]:
+        """
+        Get an entry from the cache.
+
+        :param key: The key of the entry.
+        :type key: Hashable
+
+        :return: A copy of the cached value, or None if it is missing or expired.
+        :rtype: Optional[T]
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return copy.copy(value)
+
+    def put(self, key: Hashable, value: T, ttl: Optional[float] = None) -> None:
+        """
+        Put an entry into the cache.
+
+        :param key: The key of the entry.
+        :type key: Hashable
+        :param value: The value to cache.
+        :type value: T
+        :param ttl: The time in seconds before this entry expires, defaults to the TTL of the cache.
+        :type ttl: Optional[float]
+        """
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), copy.copy(value))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Remove an entry from the cache.
+
+        :param key: The key of the entry.
+        :type key: Hashable
+        """
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Remove all entries from the cache.
+        """
+        self._data.clear()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the counters of the cache.
+
+        :return: The size, hits, misses and evictions of the cache.
+        :rtype: Dict[str, int]
+        """
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -20,6 +20,7 @@ import dataclasses
 from scyllapy.extra_types import BigInt
 
 from ....protocols import CanExecute
+from ...migrations import Migration
 from ...utils import to_bigint, to_snowflake
 
 __all__ = ("Counting", "CountingSettingsModel")
@@ -58,51 +59,66 @@ class Counting(CanExecute):
     The database class of the bot.
     """
 
-    setup_queries = [
-        """
-        CREATE TABLE IF NOT EXISTS guild_counting (
-            id BIGINT,
-            enabled BOOLEAN,
-            channel BIGINT,
-            current BIGINT,
-            previous BIGINT,
-            max BIGINT,
-            PRIMARY KEY (id)
-        );
-        """,
+    migrations = [
+        Migration(
+            "counting",
+            1,
+            "Create the guild_counting table",
+            (
+                """
+                CREATE TABLE IF NOT EXISTS guild_counting (
+                    id BIGINT,
+                    enabled BOOLEAN,
+                    channel BIGINT,
+                    current BIGINT,
+                    previous BIGINT,
+                    max BIGINT,
+                    PRIMARY KEY (id)
+                );
+                """,
+            ),
+        ),
     ]
 
-    async def inc_current_count(self, guild_id: int, user_id: int) -> None:
+    queries = {
+        "counting_checkpoint": (
+            "UPDATE guild_counting SET current = ?, previous = ?, max = ? WHERE id = ?;",
+            "write",
+        ),
+        "counting_select": ("SELECT * FROM guild_counting WHERE id = ?;", "read"),
+        "counting_update": (
+            "UPDATE guild_counting SET enabled = ?, channel = ?, current = ?, previous = ?, max = ? WHERE id = ?;",
+            "write",
+        ),
+    }
+
+    async def checkpoint_counting(self, guild_id: int, current: int, previous: int, max_count: int) -> None:
         """
-        Increment the current count in the counting game of a guild.
+        Save the state of the counting game in a guild.
 
         :param guild_id: The guild ID.
         :type guild_id: int
-        :param user_id: The user ID who incremented the count.
-        :type user_id: int
+        :param current: The current count.
+        :type current: int
+        :param previous: The user ID who counted last, -1 if nobody did.
+        :type previous: int
+        :param max_count: The highest count ever reached.
+        :type max_count: int
         """
-        result = await self.execute("SELECT current FROM guild_counting WHERE id = ?;", (to_bigint(guild_id),))
-        current = result.first().get("current", 0)
-        await self.execute(
-            "UPDATE guild_counting SET current = ?, previous = ? WHERE id = ? IF current = ?;",
-            (BigInt(current + 1), to_bigint(user_id), to_bigint(guild_id), BigInt(current)),
+        await self.execute_prepared(
+            "counting_checkpoint",
+            (BigInt(current), to_bigint(previous), BigInt(max_count), to_bigint(guild_id)),
         )
+        self.invalidate_guild_counting(guild_id)
 
-    async def reset_current_count(self, guild_id: int, current: int) -> None:
+    def invalidate_guild_counting(self, guild_id: int) -> None:
         """
-        Reset the current count in the counting game of a guild.
+        Forget the cached settings of the counting game in a guild, so the next read goes to the database.
 
         :param guild_id: The guild ID.
         :type guild_id: int
-        :param current: The current count.
-        :type current: int
         """
-        result = await self.execute("SELECT max FROM guild_counting WHERE id = ?;", (to_bigint(guild_id),))
-        new_max = max(result.first().get("max", 0), current)
-        await self.execute(
-            "UPDATE guild_counting SET current = 0, previous = ?, max = ? WHERE id = ?;",
-            (BigInt(-1), BigInt(new_max), to_bigint(guild_id)),
-        )
+        self.settings_cache.invalidate(("counting", guild_id))
 
     async def get_guild_counting(self, guild_id: int) -> CountingSettingsModel:
         """
@@ -114,8 +130,12 @@ class Counting(CanExecute):
         :return: The settings of the counting game.
         :rtype: CountingSettingsModel
         """
-        result = await self.execute("SELECT * FROM guild_counting WHERE id = ?;", (to_bigint(guild_id),))
-        return result.first(as_class=CountingSettingsModel) or CountingSettingsModel.default()
+        if (settings := self.settings_cache.get(("counting", guild_id))) is not None:
+            return settings
+        result = await self.execute_prepared("counting_select", (to_bigint(guild_id),))
+        settings = result.first(as_class=CountingSettingsModel) or CountingSettingsModel.default()
+        self.settings_cache.put(("counting", guild_id), settings)
+        return settings
 
     async def set_guild_counting(self, guild_id: int, settings: CountingSettingsModel) -> None:
         """
@@ -126,8 +146,8 @@ class Counting(CanExecute):
         :param settings: The settings of the counting game.
         :type settings: CountingSettingsModel
         """
-        await self.execute(
-            "UPDATE guild_counting SET enabled = ?, channel = ?, current = ?, previous = ?, max = ? WHERE id = ?;",
+        await self.execute_prepared(
+            "counting_update",
             (
                 settings.enabled,
                 to_bigint(settings.channel),
@@ -137,3 +157,4 @@ class Counting(CanExecute):
                 to_bigint(guild_id),
             ),
         )
+        self.settings_cache.put(("counting", guild_id), settings)
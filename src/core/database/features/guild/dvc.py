@@ -16,9 +16,12 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import dataclasses
-from typing import AsyncGenerator
+from typing import AsyncGenerator, List, Optional
+
+from scyllapy.extra_types import BigInt
 
 from ....protocols import CanExecute
+from ...migrations import Migration
 from ...utils import to_bigint, to_snowflake
 
 __all__ = ("Dvc", "DvcSettingsModel")
@@ -54,26 +57,87 @@ class Dvc(CanExecute):
     The database class of the bot.
     """
 
-    setup_queries = [
-        """
-        CREATE TABLE IF NOT EXISTS feature_dvc (
-            id BIGINT,
-            owner_id BIGINT,
-            guild_id BIGINT,
-            PRIMARY KEY (id)
-        );
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS guild_dvc (
-            id BIGINT,
-            enabled BOOLEAN,
-            lobby BIGINT,
-            name TEXT,
-            PRIMARY KEY (id)
-        );
-        """,
+    migrations = [
+        Migration(
+            "dvc",
+            1,
+            "Create the feature_dvc and guild_dvc tables",
+            (
+                """
+                CREATE TABLE IF NOT EXISTS feature_dvc (
+                    id BIGINT,
+                    owner_id BIGINT,
+                    guild_id BIGINT,
+                    PRIMARY KEY (id)
+                );
+                """,
+                """
+                CREATE TABLE IF NOT EXISTS guild_dvc (
+                    id BIGINT,
+                    enabled BOOLEAN,
+                    lobby BIGINT,
+                    name TEXT,
+                    PRIMARY KEY (id)
+                );
+                """,
+            ),
+        ),
+        Migration(
+            "dvc",
+            2,
+            "Create the guild-partitioned feature_dvc_by_guild lookup table",
+            (
+                """
+                CREATE TABLE IF NOT EXISTS feature_dvc_by_guild (
+                    guild_id BIGINT,
+                    id BIGINT,
+                    owner_id BIGINT,
+                    PRIMARY KEY (guild_id, id)
+                );
+                """,
+            ),
+        ),
+        Migration("dvc", 3, "Backfill feature_dvc_by_guild from feature_dvc", hook="backfill_dvc_by_guild"),
     ]
 
+    queries = {
+        "dvc_count": ("SELECT COUNT(*) FROM feature_dvc WHERE id = ?;", "hot_read"),
+        "dvc_select_all": ("SELECT id, owner_id, guild_id FROM feature_dvc;", "read"),
+        "dvc_select_guild": ("SELECT id FROM feature_dvc_by_guild WHERE guild_id = ?;", "read"),
+        "dvc_select_guild_id": ("SELECT guild_id FROM feature_dvc WHERE id = ?;", "read"),
+        "dvc_insert": ("INSERT INTO feature_dvc (id, owner_id, guild_id) VALUES (?, ?, ?);", "write"),
+        "dvc_insert_by_guild": (
+            "INSERT INTO feature_dvc_by_guild (guild_id, id, owner_id) VALUES (?, ?, ?);",
+            "write",
+        ),
+        "dvc_delete": ("DELETE FROM feature_dvc WHERE id = ?;", "write"),
+        "dvc_delete_by_guild": ("DELETE FROM feature_dvc_by_guild WHERE guild_id = ? AND id = ?;", "write"),
+        "dvc_count_guild": ("SELECT COUNT(*) FROM feature_dvc_by_guild WHERE guild_id = ?;", "hot_read"),
+        "dvc_select_owner": ("SELECT owner_id FROM feature_dvc WHERE id = ?;", "hot_read"),
+        "dvc_update_owner": ("UPDATE feature_dvc SET owner_id = ? WHERE id = ?;", "write"),
+        "dvc_update_owner_by_guild": (
+            "UPDATE feature_dvc_by_guild SET owner_id = ? WHERE guild_id = ? AND id = ?;",
+            "write",
+        ),
+        "dvc_settings_select": ("SELECT * FROM guild_dvc WHERE id = ?;", "hot_read"),
+        "dvc_settings_update": ("UPDATE guild_dvc SET enabled = ?, lobby = ?, name = ? WHERE id = ?;", "write"),
+    }
+
+    async def load_dvc_registry(self) -> None:
+        """
+        Load all dynamic voice channels into the in-memory registry.
+        From then on, lookups by channel or guild are answered from memory.
+        """
+        self.dvc_registry.clear()
+        result = await self.execute_prepared("dvc_select_all", paged=True)
+        async for row in result:
+            self.dvc_registry.add(
+                to_snowflake(row["id"]),
+                to_snowflake(row["owner_id"]),
+                None if row["guild_id"] is None else to_snowflake(row["guild_id"]),
+            )
+        self.dvc_registry.loaded = True
+
     async def is_dvc(self, channel_id: int) -> bool:
         """
         Checks if a channel is a dynamic voice channel.
@@ -84,7 +148,9 @@ class Dvc(CanExecute):
         :return: Whether the channel is a dynamic voice channel.
         :rtype: bool
         """
-        result = await self.execute("SELECT COUNT(*) FROM feature_dvc WHERE id = ?;", (to_bigint(channel_id),))
+        if self.dvc_registry.loaded:
+            return channel_id in self.dvc_registry
+        result = await self.execute_prepared("dvc_count", (to_bigint(channel_id),))
         return bool(result.first()["count"])
 
     async def get_dvcs(self) -> AsyncGenerator[int, None]:
@@ -94,7 +160,7 @@ class Dvc(CanExecute):
         :return: An async generator of all dynamic voice channels.
         :rtype: AsyncGenerator[int, None]
         """
-        result = await self.execute("SELECT id FROM feature_dvc;", paged=True)
+        result = await self.execute_prepared("dvc_select_all", paged=True)
         async for row in result:
             yield to_snowflake(row["id"])
 
@@ -108,9 +174,11 @@ class Dvc(CanExecute):
         :return: An async generator of all dynamic voice channels in the guild.
         :rtype: AsyncGenerator[int, None]
         """
-        result = await self.execute(
-            "SELECT id FROM feature_dvc WHERE guild_id = ? ALLOW FILTERING;", (to_bigint(guild_id),), paged=True
-        )
+        if self.dvc_registry.loaded:
+            for channel_id in self.dvc_registry.channels(guild_id):
+                yield channel_id
+            return
+        result = await self.execute_prepared("dvc_select_guild", (to_bigint(guild_id),), paged=True)
         async for row in result:
             yield to_snowflake(row["id"])
 
@@ -125,10 +193,14 @@ class Dvc(CanExecute):
         :param guild_id: The guild ID.
         :type guild_id: int
         """
-        await self.execute(
-            "INSERT INTO feature_dvc (id, owner_id, guild_id) VALUES (?, ?, ?);",
-            (to_bigint(channel_id), to_bigint(owner_id), to_bigint(guild_id)),
+        await self.execute_batch(
+            ["dvc_insert", "dvc_insert_by_guild"],
+            [
+                (to_bigint(channel_id), to_bigint(owner_id), to_bigint(guild_id)),
+                (to_bigint(guild_id), to_bigint(channel_id), to_bigint(owner_id)),
+            ],
         )
+        self.dvc_registry.add(channel_id, owner_id, guild_id)
 
     async def remove_dvc(self, channel_id: int) -> None:
         """
@@ -137,7 +209,50 @@ class Dvc(CanExecute):
         :param channel_id: The channel ID.
         :type channel_id: int
         """
-        await self.execute("DELETE FROM feature_dvc WHERE id = ?;", (to_bigint(channel_id),))
+        guild_id = await self._get_dvc_guild(channel_id)
+        if guild_id is None:
+            await self.execute_prepared("dvc_delete", (to_bigint(channel_id),))
+        else:
+            await self.execute_batch(
+                ["dvc_delete", "dvc_delete_by_guild"],
+                [(to_bigint(channel_id),), (to_bigint(guild_id), to_bigint(channel_id))],
+            )
+        self.dvc_registry.remove(channel_id)
+
+    async def remove_dvcs(self, channel_ids: List[int], batch_size: int = 50) -> None:
+        """
+        Remove many dynamic voice channels with batched deletes.
+
+        :param channel_ids: The channel IDs.
+        :type channel_ids: List[int]
+        :param batch_size: The maximum number of channels removed per batch.
+        :type batch_size: int
+        """
+        for i in range(0, len(channel_ids), batch_size):
+            names, params = [], []
+            for channel_id in channel_ids[i : i + batch_size]:
+                guild_id = await self._get_dvc_guild(channel_id)
+                names.append("dvc_delete")
+                params.append((to_bigint(channel_id),))
+                if guild_id is not None:
+                    names.append("dvc_delete_by_guild")
+                    params.append((to_bigint(guild_id), to_bigint(channel_id)))
+            await self.execute_batch(names, params)
+            # the registry follows the database, a failed batch leaves its channels registered
+            for channel_id in channel_ids[i : i + batch_size]:
+                self.dvc_registry.remove(channel_id)
+
+    async def _get_dvc_guild(self, channel_id: int) -> Optional[int]:
+        """
+        Get the guild of a dynamic voice channel.
+        This is an internal method and should not be called directly.
+        """
+        if self.dvc_registry.loaded:
+            return self.dvc_registry.guild(channel_id)
+        result = await self.execute_prepared("dvc_select_guild_id", (to_bigint(channel_id),))
+        if (row := result.first()) is None or row["guild_id"] is None:
+            return None
+        return to_snowflake(row["guild_id"])
 
     async def get_guild_dvc_count(self, guild_id: int) -> int:
         """
@@ -149,23 +264,27 @@ class Dvc(CanExecute):
         :return: The number of dynamic voice channels in the guild.
         :rtype: int
         """
-        result = await self.execute(
-            "SELECT COUNT(*) FROM feature_dvc WHERE guild_id = ? ALLOW FILTERING;", (to_bigint(guild_id),)
-        )
+        if self.dvc_registry.loaded:
+            return self.dvc_registry.count(guild_id)
+        result = await self.execute_prepared("dvc_count_guild", (to_bigint(guild_id),))
         return result.first()["count"]
 
-    async def get_dvc_owner(self, channel_id: int) -> int:
+    async def get_dvc_owner(self, channel_id: int) -> Optional[int]:
         """
         Get the owner of a dynamic voice channel.
 
         :param channel_id: The channel ID.
         :type channel_id: int
 
-        :return: The owner ID.
-        :rtype: int
+        :return: The owner ID, or None if the channel is not a dynamic voice channel.
+        :rtype: Optional[int]
         """
-        result = await self.execute("SELECT owner_id FROM feature_dvc WHERE id = ?;", (to_bigint(channel_id),))
-        return to_snowflake(result.first()["owner_id"])
+        if self.dvc_registry.loaded:
+            return self.dvc_registry.owner(channel_id)
+        result = await self.execute_prepared("dvc_select_owner", (to_bigint(channel_id),))
+        if (row := result.first()) is None:
+            return None
+        return to_snowflake(row["owner_id"])
 
     async def set_dvc_owner(self, channel_id: int, owner_id: int) -> None:
         """
@@ -176,9 +295,32 @@ class Dvc(CanExecute):
         :param owner_id: The owner ID.
         :type owner_id: int
         """
-        await self.execute(
-            "UPDATE feature_dvc SET owner_id = ? WHERE id = ?;", (to_bigint(owner_id), to_bigint(channel_id))
-        )
+        guild_id = await self._get_dvc_guild(channel_id)
+        if guild_id is None:
+            await self.execute_prepared("dvc_update_owner", (to_bigint(owner_id), to_bigint(channel_id)))
+        else:
+            await self.execute_batch(
+                ["dvc_update_owner", "dvc_update_owner_by_guild"],
+                [
+                    (to_bigint(owner_id), to_bigint(channel_id)),
+                    (to_bigint(owner_id), to_bigint(guild_id), to_bigint(channel_id)),
+                ],
+            )
+        self.dvc_registry.set_owner(channel_id, owner_id)
+
+    async def backfill_dvc_by_guild(self) -> None:
+        """
+        Populate the guild-partitioned lookup table from the existing dynamic voice channels.
+        This is run once by the migration engine, so it uses plain statements instead of the prepared ones.
+        """
+        rows = await self.execute("SELECT id, owner_id, guild_id FROM feature_dvc;", paged=True)
+        async for row in rows:
+            if row["guild_id"] is None:
+                continue
+            await self.execute(
+                "INSERT INTO feature_dvc_by_guild (guild_id, id, owner_id) VALUES (?, ?, ?);",
+                (BigInt(row["guild_id"]), BigInt(row["id"]), BigInt(row["owner_id"])),
+            )
 
     async def get_guild_dvc_settings(self, guild_id: int) -> DvcSettingsModel:
         """
@@ -190,8 +332,12 @@ class Dvc(CanExecute):
         :return: The settings of the dynamic voice channels in the guild.
         :rtype: DvcSettingsModel
         """
-        result = await self.execute("SELECT * FROM guild_dvc WHERE id = ?;", (to_bigint(guild_id),))
-        return result.first(as_class=DvcSettingsModel) or DvcSettingsModel.default()
+        if (settings := self.settings_cache.get(("dvc", guild_id))) is not None:
+            return settings
+        result = await self.execute_prepared("dvc_settings_select", (to_bigint(guild_id),))
+        settings = result.first(as_class=DvcSettingsModel) or DvcSettingsModel.default()
+        self.settings_cache.put(("dvc", guild_id), settings)
+        return settings
 
     async def set_guild_dvc_settings(self, guild_id: int, settings: DvcSettingsModel) -> None:
         """
@@ -202,7 +348,8 @@ class Dvc(CanExecute):
         :param settings: The settings of the dynamic voice channels.
         :type settings: DvcSettingsModel
         """
-        await self.execute(
-            "UPDATE guild_dvc SET enabled = ?, lobby = ?, name = ? WHERE id = ?;",
+        await self.execute_prepared(
+            "dvc_settings_update",
             (settings.enabled, to_bigint(settings.lobby), settings.name or "", to_bigint(guild_id)),
         )
+        self.settings_cache.put(("dvc", guild_id), settings)
@@ -18,6 +18,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import dataclasses
 
 from ....protocols import CanExecute
+from ...migrations import Migration
 from ...utils import to_bigint
 
 __all__ = ("Safety", "SafetySettingsModel")
@@ -59,17 +60,29 @@ class Safety(CanExecute):
     The database class of the bot.
     """
 
-    setup_queries = [
-        """
-        CREATE TABLE IF NOT EXISTS guild_safety (
-            id BIGINT,
-            dtoken BOOLEAN,
-            url BOOLEAN,
-            PRIMARY KEY (id)
-        );
-        """
+    migrations = [
+        Migration(
+            "safety",
+            1,
+            "Create the guild_safety table",
+            (
+                """
+                CREATE TABLE IF NOT EXISTS guild_safety (
+                    id BIGINT,
+                    dtoken BOOLEAN,
+                    url BOOLEAN,
+                    PRIMARY KEY (id)
+                );
+                """,
+            ),
+        ),
     ]
 
+    queries = {
+        "safety_select": ("SELECT * FROM guild_safety WHERE id = ?;", "hot_read"),
+        "safety_update": ("UPDATE guild_safety SET dtoken = ?, url = ? WHERE id = ?;", "write"),
+    }
+
     async def get_guild_safety_settings(self, guild_id: int) -> SafetySettingsModel:
         """
         Get the safety settings of a guild.
@@ -80,8 +93,12 @@ class Safety(CanExecute):
         :return: The safety settings of the guild.
         :rtype: SafetySettingsModel
         """
-        result = await self.execute("SELECT * FROM guild_safety WHERE id = ?;", (to_bigint(guild_id),))
-        return result.first(as_class=SafetySettingsModel) or SafetySettingsModel.default()
+        if (settings := self.settings_cache.get(("safety", guild_id))) is not None:
+            return settings
+        result = await self.execute_prepared("safety_select", (to_bigint(guild_id),))
+        settings = result.first(as_class=SafetySettingsModel) or SafetySettingsModel.default()
+        self.settings_cache.put(("safety", guild_id), settings)
+        return settings
 
     async def set_guild_safety_settings(self, guild_id: int, settings: SafetySettingsModel) -> None:
         """
@@ -92,7 +109,8 @@ class Safety(CanExecute):
         :param settings: The safety settings.
         :type settings: SafetySettingsModel
         """
-        await self.execute(
-            "UPDATE guild_safety SET dtoken = ?, url = ? WHERE id = ?;",
+        await self.execute_prepared(
+            "safety_update",
             (settings.dtoken, settings.url, to_bigint(guild_id)),
         )
+        self.settings_cache.put(("safety", guild_id), settings)
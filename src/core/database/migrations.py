@@ -0,0 +1,193 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import dataclasses
+import time
+from typing import TYPE_CHECKING, List, Optional, Set, Tuple
+
+from scyllapy.exceptions import ScyllaPyDBError
+
+if TYPE_CHECKING:
+    from . import DatabaseClient
+
+__all__ = ("Migration", "MigrationEngine", "SchemaAgreementError")
+
+
+class SchemaAgreementError(ScyllaPyDBError):
+    """
+    Raised when the nodes do not agree on the schema version after a schema change.
+    """
+
+
+@dataclasses.dataclass(frozen=True)
+class Migration:
+    """
+    A single, idempotent schema migration step of a feature.
+    """
+
+    feature: str
+    version: int
+    description: str
+    queries: Tuple[str, ...] = ()
+    hook: Optional[str] = None  # the name of a coroutine method of the database client to run after the queries
+
+    @property
+    def key(self) -> Tuple[str, int]:
+        """
+        Get the unique key of the migration.
+
+        :return: The feature name and version.
+        :rtype: Tuple[str, int]
+        """
+        return self.feature, self.version
+
+
+class MigrationEngine:
+    """
+    Applies the migrations declared by the database features in order, and records them in `schema_migrations`.
+    """
+
+    setup_query = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        feature TEXT,
+        version INT,
+        description TEXT,
+        applied_at TIMESTAMP,
+        PRIMARY KEY (feature, version)
+    );
+    """
+
+    def __init__(self, client: "DatabaseClient", agreement_timeout: float = 10) -> None:
+        """
+        Initialize the migration engine.
+
+        :param client: The database client to migrate.
+        :type client: DatabaseClient
+        :param agreement_timeout: The maximum time in seconds to wait for schema agreement.
+        :type agreement_timeout: float
+        """
+        self.client = client
+        self.agreement_timeout = agreement_timeout
+
+    @property
+    def migrations(self) -> List[Migration]:
+        """
+        Get all migrations declared by the features, ordered by feature and version.
+
+        :raises ValueError: Raised when a migration key is declared twice.
+
+        :return: The migrations.
+        :rtype: List[Migration]
+        """
+        migrations = {}
+        for cls in type(self.client).__bases__:
+            for migration in sorted(getattr(cls, "migrations", []), key=lambda m: m.version):
+                if migration.key in migrations:
+                    raise ValueError(f"Duplicated migration: {migration.feature} v{migration.version}")
+                migrations[migration.key] = migration
+        return list(migrations.values())
+
+    async def applied(self) -> Set[Tuple[str, int]]:
+        """
+        Get the keys of the applied migrations with a single read.
+        Nothing has been applied if the `schema_migrations` table does not exist yet.
+
+        :raises ScyllaPyDBError: Raised when the read fails for another reason than the missing table.
+
+        :return: The applied migration keys.
+        :rtype: Set[Tuple[str, int]]
+        """
+        try:
+            result = await self.client.scylla.execute("SELECT feature, version FROM schema_migrations;")
+        except ScyllaPyDBError as e:
+            # the driver has no dedicated error for an invalid table, only its message tells it apart
+            if "unconfigured table" not in str(e).lower():
+                raise
+            return set()
+        return {(row["feature"], row["version"]) for row in result.all()}
+
+    async def pending(self) -> List[Migration]:
+        """
+        Get the migrations that have not been applied yet.
+
+        :return: The pending migrations.
+        :rtype: List[Migration]
+        """
+        applied = await self.applied()
+        return [i for i in self.migrations if i.key not in applied]
+
+    async def run(self, dry_run: bool = False) -> List[Migration]:
+        """
+        Apply all pending migrations.
+        If the schema is already up to date, this only costs one read. A dry run never writes anything.
+
+        :param dry_run: Whether to only report the pending migrations without applying them.
+        :type dry_run: bool
+
+        :raises SchemaAgreementError: Raised when the nodes do not agree on the schema after a migration,
+            the migration is then not recorded and the following migrations are not applied.
+
+        :return: The applied (or, in dry-run mode, pending) migrations.
+        :rtype: List[Migration]
+        """
+        pending = await self.pending()
+        if dry_run or not pending:
+            return pending
+        await self.client.scylla.execute(self.setup_query)
+        await self.ensure_schema_agreement()
+        for migration in pending:
+            for query in migration.queries:
+                await self.client.scylla.execute(query)
+            # a migration is only recorded once every node has its schema changes
+            if migration.queries:
+                await self.ensure_schema_agreement()
+            if migration.hook:
+                await getattr(self.client, migration.hook)()
+            await self.client.scylla.execute(
+                "INSERT INTO schema_migrations (feature, version, description, applied_at)"
+                " VALUES (?, ?, ?, toTimestamp(now()));",
+                (migration.feature, migration.version, migration.description),
+            )
+        return pending
+
+    async def ensure_schema_agreement(self) -> None:
+        """
+        Wait until every node reports the same schema version.
+
+        :raises SchemaAgreementError: Raised when the nodes did not agree before the timeout.
+        """
+        if not await self.wait_for_schema_agreement():
+            raise SchemaAgreementError(f"The schema was not agreed on within {self.agreement_timeout} seconds.")
+
+    async def wait_for_schema_agreement(self) -> bool:
+        """
+        Wait until every node reports the same schema version.
+
+        :return: Whether the nodes agreed before the timeout.
+        :rtype: bool
+        """
+        deadline = time.monotonic() + self.agreement_timeout
+        while True:
+            local = await self.client.scylla.execute("SELECT schema_version FROM system.local;")
+            peers = await self.client.scylla.execute("SELECT schema_version FROM system.peers;")
+            versions = {row["schema_version"] for row in [*local.all(), *peers.all()]}
+            if len(versions) <= 1:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.2)
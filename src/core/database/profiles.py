@@ -0,0 +1,65 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from typing import Any, Dict, Optional
+
+from scyllapy import Consistency, ExecutionProfile, SerialConsistency
+
+__all__ = ("DEFAULT_PROFILES", "build_profiles")
+
+DEFAULT_PROFILES: Dict[str, Dict[str, Any]] = {
+    # reads on the per-event path, where a slightly stale answer is fine
+    "hot_read": {"consistency": "ONE", "request_timeout": 2},
+    "read": {"consistency": "QUORUM"},
+    "write": {"consistency": "QUORUM"},
+    # lightweight transactions and the reads they depend on
+    "lwt": {"consistency": "QUORUM", "serial_consistency": "SERIAL"},
+}
+
+
+def build_profiles(config: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, ExecutionProfile]:
+    """
+    Build the named execution profiles.
+    The values from the configuration are merged over the default profiles.
+
+    :param config: The profiles from the configuration file (`database.profiles`).
+    :type config: Optional[Dict[str, Dict[str, Any]]]
+
+    :raises ValueError: Raised when a consistency level is unknown.
+
+    :return: The execution profiles mapped by their names.
+    :rtype: Dict[str, ExecutionProfile]
+    """
+    merged = {name: dict(values) for name, values in DEFAULT_PROFILES.items()}
+    for name, values in (config or {}).items():
+        merged.setdefault(name, {}).update(values)
+
+    profiles = {}
+    for name, values in merged.items():
+        try:
+            consistency = values.get("consistency")
+            serial_consistency = values.get("serial_consistency")
+            profiles[name] = ExecutionProfile(
+                consistency=getattr(Consistency, consistency.upper()) if consistency else None,
+                serial_consistency=(
+                    getattr(SerialConsistency, serial_consistency.upper()) if serial_consistency else None
+                ),
+                request_timeout=values.get("request_timeout"),
+            )
+        except AttributeError as e:
+            raise ValueError(f"Invalid consistency level in execution profile {name}.") from e
+    return profiles
@@ -0,0 +1,148 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+__all__ = ("DvcRegistry",)
+
+
+class DvcRegistry:
+    """
+    An in-memory index of the dynamic voice channels, mapping every channel to its guild and owner.
+    It mirrors `feature_dvc` and is kept current by the database methods that write to it.
+    """
+
+    def __init__(self) -> None:
+        self.loaded = False
+        self._channels: Dict[int, Tuple[Optional[int], int]] = {}  # channel: (guild, owner)
+        self._guilds: Dict[int, Set[int]] = {}
+
+    def add(self, channel_id: int, owner_id: int, guild_id: Optional[int]) -> None:
+        """
+        Add a dynamic voice channel.
+
+        :param channel_id: The channel ID.
+        :type channel_id: int
+        :param owner_id: The owner ID.
+        :type owner_id: int
+        :param guild_id: The guild ID, which is unknown for rows created before it was stored.
+        :type guild_id: Optional[int]
+        """
+        channel_id, owner_id = int(channel_id), int(owner_id)
+        guild_id = None if guild_id is None else int(guild_id)
+        self.remove(channel_id)
+        self._channels[channel_id] = (guild_id, owner_id)
+        if guild_id is not None:
+            self._guilds.setdefault(guild_id, set()).add(channel_id)
+
+    def remove(self, channel_id: int) -> None:
+        """
+        Remove a dynamic voice channel.
+
+        :param channel_id: The channel ID.
+        :type channel_id: int
+        """
+        guild_id, _ = self._channels.pop(channel_id, (None, None))
+        if guild_id is not None and guild_id in self._guilds:
+            self._guilds[guild_id].discard(channel_id)
+            if not self._guilds[guild_id]:
+                del self._guilds[guild_id]
+
+    def set_owner(self, channel_id: int, owner_id: int) -> None:
+        """
+        Set the owner of a dynamic voice channel.
+
+        :param channel_id: The channel ID.
+        :type channel_id: int
+        :param owner_id: The owner ID.
+        :type owner_id: int
+        """
+        if channel_id in self._channels:
+            self._channels[channel_id] = (self._channels[channel_id][0], int(owner_id))
+
+    def owner(self, channel_id: int) -> Optional[int]:
+        """
+        Get the owner of a dynamic voice channel.
+
+        :param channel_id: The channel ID.
+        :type channel_id: int
+
+        :return: The owner ID, or None if the channel is not a dynamic voice channel.
+        :rtype: Optional[int]
+        """
+        return self._channels.get(channel_id, (None, None))[1]
+
+    def guild(self, channel_id: int) -> Optional[int]:
+        """
+        Get the guild of a dynamic voice channel.
+
+        :param channel_id: The channel ID.
+        :type channel_id: int
+
+        :return: The guild ID, or None if it is unknown.
+        :rtype: Optional[int]
+        """
+        return self._channels.get(channel_id, (None, None))[0]
+
+    def channels(self, guild_id: int) -> Set[int]:
+        """
+        Get the dynamic voice channels of a guild.
+
+        :param guild_id: The guild ID.
+        :type guild_id: int
+
+        :return: A copy of the channel IDs.
+        :rtype: Set[int]
+        """
+        return set(self._guilds.get(guild_id, ()))
+
+    def guilds(self) -> List[int]:
+        """
+        Get the guilds that have dynamic voice channels.
+
+        :return: The guild IDs.
+        :rtype: List[int]
+        """
+        return list(self._guilds)
+
+    def count(self, guild_id: int) -> int:
+        """
+        Get the number of dynamic voice channels in a guild.
+
+        :param guild_id: The guild ID.
+        :type guild_id: int
+
+        :return: The number of channels.
+        :rtype: int
+        """
+        return len(self._guilds.get(guild_id, ()))
+
+    def clear(self) -> None:
+        """
+        Remove all dynamic voice channels.
+        """
+        self._channels.clear()
+        self._guilds.clear()
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self._channels
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self._channels))
+
+    def __len__(self) -> int:
+        return len(self._channels)
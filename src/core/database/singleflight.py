@@ -0,0 +1,74 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, TypeVar
+
+__all__ = ("SingleFlight",)
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """
+    Coalesces concurrent calls with the same key into a single in-flight call.
+    Every caller that arrives while the call is running receives the same result (or exception).
+    """
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, "asyncio.Task[T]"] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run a call, or join the in-flight call with the same key.
+
+        :param key: The key identifying identical calls.
+        :type key: Hashable
+        :param func: The function creating the awaitable to run.
+        :type func: Callable[[], Awaitable[T]]
+
+        :return: The result of the call.
+        :rtype: T
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.executed += 1
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._calls.pop(key) if self._calls.get(key) is t else None)
+        else:
+            self.coalesced += 1
+        # shield the shared task so that one cancelled caller does not cancel it for everyone else
+        return await asyncio.shield(task)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the counters of the single-flight group.
+
+        :return: The executed, coalesced and in-flight calls, and the ratio of calls that were coalesced.
+        :rtype: Dict[str, Any]
+        """
+        total = self.executed + self.coalesced
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+            "ratio": self.coalesced / total if total else 0.0,
+        }
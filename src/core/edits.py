@@ -0,0 +1,156 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+from src.utils import Ratelimited
+
+if TYPE_CHECKING:
+    from .http import ModifiedHTTPClient
+    from .logging import Logger
+
+__all__ = ("ChannelEditQueue",)
+
+
+class ChannelEditQueue:
+    """
+    Applies channel edits right away if the route allows it, otherwise queues them until it does.
+    Edits queued for the same channel are merged, so they are applied with a single request.
+    """
+
+    def __init__(
+        self,
+        http: "ModifiedHTTPClient",
+        on_applied: Callable[[dict], Any],
+        logger: "Logger",
+        default_retry_after: float = 10,
+    ) -> None:
+        """
+        Initialize the queue.
+
+        :param http: The HTTP client.
+        :type http: ModifiedHTTPClient
+        :param on_applied: Called with the channel data returned by every applied edit.
+        :type on_applied: Callable[[dict], Any]
+        :param logger: The logger to report edits that failed in the background.
+        :type logger: Logger
+        :param default_retry_after: The time in seconds to wait if Discord does not say how long to wait.
+        :type default_retry_after: float
+        """
+        self.http = http
+        self.on_applied = on_applied
+        self.logger = logger
+        self.default_retry_after = default_retry_after
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._reasons: Dict[int, Optional[str]] = {}
+        self._apply_at: Dict[int, float] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def pending(self, channel_id: int) -> Optional[float]:
+        """
+        Get when the queued edits of a channel will be applied.
+
+        :param channel_id: The channel ID.
+        :type channel_id: int
+
+        :return: The UNIX timestamp, or None if there are no queued edits.
+        :rtype: Optional[float]
+        """
+        return self._apply_at.get(channel_id)
+
+    async def edit(self, channel_id: int, payload: Dict[str, Any], reason: Optional[str] = None) -> Optional[float]:
+        """
+        Edit a channel, or queue the edit if the route is rate limited.
+
+        :param channel_id: The channel ID.
+        :type channel_id: int
+        :param payload: The fields to change.
+        :type payload: Dict[str, Any]
+        :param reason: The audit log reason.
+        :type reason: Optional[str]
+
+        :raises HTTPException: Raised when the edit is rejected for another reason.
+
+        :return: None if the edit was applied, otherwise the UNIX timestamp it will be applied at.
+        :rtype: Optional[float]
+        """
+        channel_id = int(channel_id)
+        if channel_id in self._pending:
+            self._pending[channel_id].update(payload)
+            self._reasons[channel_id] = reason
+            return self._apply_at[channel_id]
+        try:
+            await self._modify(channel_id, payload, reason)
+            return None
+        except Ratelimited as e:
+            delay = self._retry_after(e)
+        self._pending[channel_id] = dict(payload)
+        self._reasons[channel_id] = reason
+        self._apply_at[channel_id] = time.time() + delay
+        self._tasks[channel_id] = asyncio.create_task(self._apply_later(channel_id, delay))
+        return self._apply_at[channel_id]
+
+    async def _modify(self, channel_id: int, payload: Dict[str, Any], reason: Optional[str]) -> None:
+        """
+        Send an edit and hand the updated channel to the callback.
+        This is an internal method and should not be called directly.
+        """
+        self.on_applied(await self.http.modify_channel_raise(channel_id, payload, reason))
+
+    def _retry_after(self, error: Ratelimited) -> float:
+        return float(error.retry_after) if error.retry_after else self.default_retry_after
+
+    async def _apply_later(self, channel_id: int, delay: float) -> None:
+        """
+        Apply the queued edits of a channel once the route allows it.
+        This is an internal method and should not be called directly.
+        """
+        try:
+            while True:
+                await asyncio.sleep(delay)
+                payload = dict(self._pending[channel_id])
+                try:
+                    await self._modify(channel_id, payload, self._reasons[channel_id])
+                except Ratelimited as e:
+                    delay = self._retry_after(e)
+                    self._apply_at[channel_id] = time.time() + delay
+                    continue
+                # edits merged while the request was in flight are applied with another request
+                pending = self._pending[channel_id]
+                for key, value in payload.items():
+                    if pending.get(key) == value:
+                        del pending[key]
+                if not pending:
+                    return
+                delay = 0
+        except Exception as e:  # pylint: disable=broad-except
+            # nobody awaits this task, so every error has to be reported here
+            self.logger.warning(f"Failed to apply the queued edits of channel {channel_id}: {e!r}")
+        finally:
+            self._pending.pop(channel_id, None)
+            self._reasons.pop(channel_id, None)
+            self._apply_at.pop(channel_id, None)
+            self._tasks.pop(channel_id, None)
+
+    def cancel(self) -> None:
+        """
+        Cancel all queued edits.
+        """
+        for i in list(self._tasks.values()):
+            i.cancel()
@@ -16,19 +16,26 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import asyncio
-from typing import TYPE_CHECKING, Any, cast
+import errno
+import itertools
+import time
+from typing import TYPE_CHECKING, Any, Optional, cast
 from urllib.parse import quote as _uriquote
 
 import discord_typings
 import interactions
 from aiohttp import FormData
-from interactions.api.http.http_client import HTTPClient
+from interactions.api.http.http_client import GlobalLock, HTTPClient
 from interactions.api.http.route import Route
 from interactions.client.utils import dict_filter, response_decode
 
 from src.utils import Ratelimited
 
+from .metrics import HTTPMetrics
+from .priority import Priority, RequestScheduler
 from .protocols import CanRequest
+from .ratelimit import RateLimitPredictor
+from .retry import RetryPolicy
 
 if TYPE_CHECKING:
     from interactions.models.discord.snowflake import Snowflake_Type
@@ -65,12 +72,45 @@ class RaiseRequests(CanRequest):
         return cast(discord_typings.ChannelData, result)
 
 
+class MeasuredGlobalLock(GlobalLock):
+    """
+    The global rate limit lock, recording how long the requests wait for it.
+    """
+
+    def __init__(self, metrics: HTTPMetrics) -> None:
+        super().__init__()
+        self.metrics = metrics
+
+    async def wait(self) -> None:
+        started_at = time.perf_counter()
+        await super().wait()
+        self.metrics.observe_lock_wait(time.perf_counter() - started_at)
+
+
 class ModifiedHTTPClient(HTTPClient, RaiseRequests):
     """
     The modified HTTP client.
     """
 
-    async def request(  # noqa: C901
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.predictor = RateLimitPredictor()
+        self.retry = RetryPolicy(self._max_attempts)
+        self.metrics = HTTPMetrics()
+        self.global_lock = MeasuredGlobalLock(self.metrics)
+        self.scheduler = RequestScheduler(self)
+        self._instrumented = None
+
+    def _instrument(self) -> None:
+        """
+        Add the trace hooks of the metrics to the current session, the session is replaced on every login.
+        """
+        session = self._HTTPClient__session
+        if session is not None and session is not self._instrumented:
+            session._trace_configs.append(self.metrics.trace_config)  # pylint: disable=protected-access
+            self._instrumented = session
+
+    async def request(
         self,
         route: Route,
         payload: list | dict | None = None,
@@ -78,11 +118,30 @@ class ModifiedHTTPClient(HTTPClient, RaiseRequests):
         reason: str | None = None,
         params: dict | None = None,
         skip_ratelimit: bool = False,
+        priority: Optional[Priority] = None,
         **kwargs: dict,
     ) -> str | dict[str, Any] | None:
         """
-        Make a request to discord.
+        Make a request to discord, the requests with a higher priority are sent first under contention.
+        The priority defaults to the one of the route and the current context, see `request_priority`.
         """
+        if priority is None:
+            priority = self.scheduler.priority_of(route)
+        async with self.scheduler.slot(route, priority):
+            return await self._request(route, payload, files, reason, params, skip_ratelimit, **kwargs)
+
+    async def _request(  # noqa: C901
+        self,
+        route: Route,
+        payload: list | dict | None,
+        files: list[interactions.UPLOADABLE_TYPE] | None,
+        reason: str | None,
+        params: dict | None,
+        skip_ratelimit: bool,
+        **kwargs: dict,
+    ) -> str | dict[str, Any] | None:
+        self._instrument()
+        kwargs["trace_request_ctx"] = route
         if not skip_ratelimit:
             return await super().request(route, payload, files, reason, params, **kwargs)
 
@@ -97,10 +156,19 @@ class ModifiedHTTPClient(HTTPClient, RaiseRequests):
         if isinstance(params, dict):
             kwargs["params"] = dict_filter(params)
 
-        for attempt in range(self._max_attempts):
+        # fail before sending a request that would only be answered with a 429
+        if retry_after := self.predictor.acquire(route):
+            raise Ratelimited(
+                f"{route.resolved_endpoint} Is predicted to be rate limited! Reset in {retry_after:.2f} seconds",
+                retry_after,
+            )
+
+        started_at = time.monotonic()
+        for attempt in itertools.count():
             try:
                 if self._HTTPClient__session.closed:
                     await self.login(cast(str, self.token))
+                    self._instrument()
 
                 processed_data = self._process_payload(payload, files)
                 if isinstance(processed_data, FormData):
@@ -115,6 +183,7 @@ class ModifiedHTTPClient(HTTPClient, RaiseRequests):
 
                 async with self._HTTPClient__session.request(route.method, route.url, **kwargs) as response:
                     result = await response_decode(response)
+                    self.predictor.update(route, response.headers)
 
                     if response.status == 429:
                         result = cast(dict[str, str], result)
@@ -125,27 +194,35 @@ class ModifiedHTTPClient(HTTPClient, RaiseRequests):
                                 f" locking REST API for {result['retry_after']} seconds",
                             )
                             self.global_lock.set_reset_time(float(result["retry_after"]))
-                        elif result.get("message") == "The resource is being rate limited.":
+                            raise Ratelimited(
+                                f"{route.resolved_endpoint} Has exceeded the global ratelimit!", result["retry_after"]
+                            )
+                        if result.get("message") == "The resource is being rate limited.":
                             raise Ratelimited(
                                 f"{route.resolved_endpoint} The resource is being rate limited!"
                                 f" Reset in {result.get('retry_after')} seconds",
                                 result.get("retry_after"),
                             )
-                        else:
-                            raise Ratelimited(f"{route.resolved_endpoint} Has exceeded its ratelimit!")
-                    elif response.status in {500, 502, 504}:
-                        self.logger.warning(
-                            f"{route.resolved_endpoint} Received {response.status}..."
-                            f" retrying in {1 + attempt * 2} seconds"
+                        raise Ratelimited(
+                            f"{route.resolved_endpoint} Has exceeded its ratelimit!", result.get("retry_after")
                         )
-                        await asyncio.sleep(1 + attempt * 2)
-                        continue
+                    if response.status in self.retry.statuses:
+                        retry_after = self.retry.parse_retry_after(response.headers.get("Retry-After"))
+                        if (delay := self.retry.backoff(attempt, started_at, retry_after)) is not None:
+                            self.logger.warning(
+                                f"{route.resolved_endpoint} Received {response.status}..."
+                                f" retrying in {delay:.2f} seconds"
+                            )
+                            await asyncio.sleep(delay)
+                            continue
 
                     if not 300 > response.status >= 200:
                         await self._raise_exception(response, route, result)
                     return result
             except OSError as e:
-                if attempt < self._max_attempts - 1 and e.errno in (54, 10054):
-                    await asyncio.sleep(1 + attempt * 2)
-                    continue
-                raise
+                if (
+                    e.errno not in (errno.ECONNRESET, 54, 10054)
+                    or (delay := self.retry.backoff(attempt, started_at)) is None
+                ):
+                    raise
+                await asyncio.sleep(delay)
@@ -0,0 +1,261 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import bisect
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import aiohttp
+from interactions.api.http.route import Route
+
+__all__ = ("HTTPMetrics", "RouteMetrics", "LATENCY_BUCKETS")
+
+LATENCY_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """
+    A histogram with fixed bucket bounds, the last bucket holds everything above the largest bound.
+    """
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Add a value to the histogram.
+
+        :param value: The value.
+        :type value: float
+        """
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile, interpolating linearly inside the bucket it falls in.
+
+        :param q: The quantile, between 0 and 1.
+        :type q: float
+
+        :return: The estimated value, or 0 if the histogram is empty.
+        :rtype: float
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """
+        Get the cumulative bucket counts, as used by the Prometheus text format.
+
+        :return: The upper bounds (the last one is infinity) and the number of values up to them.
+        :rtype: List[Tuple[float, int]]
+        """
+        total = 0
+        result = []
+        for bound, count in zip((*self.bounds, float("inf")), self.buckets):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class RouteMetrics:
+    """
+    The metrics of a single route.
+    """
+
+    def __init__(self) -> None:
+        self.latency = Histogram()
+        self.statuses: Counter[int] = Counter()
+        self.global_limits = 0
+        self.bucket_limits = 0
+        self.errors = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get the metrics of the route.
+
+        :return: The request count, latency quantiles in seconds, status counts, 429s and connection errors.
+        :rtype: Dict[str, Any]
+        """
+        return {
+            "count": self.latency.count,
+            "p50": self.latency.quantile(0.5),
+            "p95": self.latency.quantile(0.95),
+            "p99": self.latency.quantile(0.99),
+            "max": self.latency.max,
+            "statuses": dict(self.statuses),
+            "global_limits": self.global_limits,
+            "bucket_limits": self.bucket_limits,
+            "errors": self.errors,
+        }
+
+
+class HTTPMetrics:
+    """
+    Collects per-route metrics of the requests sent to Discord.
+    Every HTTP response is recorded, including the retries, through the aiohttp trace hooks of the client session.
+    The latency is measured from sending the request until the response headers arrive.
+    """
+
+    def __init__(self) -> None:
+        self.routes: Dict[str, RouteMetrics] = {}
+        self.lock_wait = Histogram()
+        self.started_at = time.monotonic()
+        self.trace_config = aiohttp.TraceConfig()
+        self.trace_config.on_request_start.append(self._on_request_start)
+        self.trace_config.on_request_end.append(self._on_request_end)
+        self.trace_config.on_request_exception.append(self._on_request_exception)
+        self.trace_config.freeze()
+
+    def _route(self, context: SimpleNamespace) -> Optional[RouteMetrics]:
+        route = getattr(context, "trace_request_ctx", None)
+        if not isinstance(route, Route):
+            return None
+        # the endpoint has the parameters unresolved, so there is one entry per route and not per channel
+        if (metrics := self.routes.get(route.endpoint)) is None:
+            metrics = self.routes[route.endpoint] = RouteMetrics()
+        return metrics
+
+    async def _on_request_start(
+        self, _session: aiohttp.ClientSession, context: SimpleNamespace, _params: aiohttp.TraceRequestStartParams
+    ) -> None:
+        context.started_at = time.perf_counter()
+
+    async def _on_request_end(
+        self, _session: aiohttp.ClientSession, context: SimpleNamespace, params: aiohttp.TraceRequestEndParams
+    ) -> None:
+        if (metrics := self._route(context)) is None:
+            return
+        self.observe(
+            metrics, params.response.status, time.perf_counter() - context.started_at, params.response.headers
+        )
+
+    async def _on_request_exception(
+        self, _session: aiohttp.ClientSession, context: SimpleNamespace, _params: aiohttp.TraceRequestExceptionParams
+    ) -> None:
+        if (metrics := self._route(context)) is not None:
+            metrics.errors += 1
+
+    @staticmethod
+    def observe(metrics: RouteMetrics, status: int, latency: float, headers: Mapping[str, str]) -> None:
+        """
+        Record a response.
+
+        :param metrics: The metrics of the requested route.
+        :type metrics: RouteMetrics
+        :param status: The response status.
+        :type status: int
+        :param latency: The latency in seconds.
+        :type latency: float
+        :param headers: The response headers.
+        :type headers: Mapping[str, str]
+        """
+        metrics.latency.observe(latency)
+        metrics.statuses[status] += 1
+        if status == 429:
+            if headers.get("x-ratelimit-global") == "true" or headers.get("x-ratelimit-scope") == "global":
+                metrics.global_limits += 1
+            else:
+                metrics.bucket_limits += 1
+
+    def observe_lock_wait(self, seconds: float) -> None:
+        """
+        Record the time a request waited for the global rate limit.
+
+        :param seconds: The wait in seconds.
+        :type seconds: float
+        """
+        self.lock_wait.observe(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Get all metrics.
+
+        :return: The metrics of every route, the global lock wait and the seconds since the metrics were reset.
+        :rtype: Dict[str, Any]
+        """
+        return {
+            "uptime": time.monotonic() - self.started_at,
+            "routes": {name: metrics.snapshot() for name, metrics in self.routes.items()},
+            "lock_wait": {
+                "count": self.lock_wait.count,
+                "total": self.lock_wait.sum,
+                "p95": self.lock_wait.quantile(0.95),
+                "max": self.lock_wait.max,
+            },
+        }
+
+    def export(self) -> str:
+        """
+        Export all metrics in the Prometheus text format.
+
+        :return: The exported metrics.
+        :rtype: str
+        """
+        # the lines of a family must follow its TYPE line without other families in between
+        routes = [(name.replace("\\", "\\\\").replace('"', '\\"'), i) for name, i in sorted(self.routes.items())]
+        lines = ["# TYPE discord_http_request_duration_seconds histogram"]
+        for route, metrics in routes:
+            for bound, count in metrics.latency.cumulative():
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'discord_http_request_duration_seconds_bucket{{route="{route}",le="{le}"}} {count}')
+            lines.append(f'discord_http_request_duration_seconds_sum{{route="{route}"}} {metrics.latency.sum:.6f}')
+            lines.append(f'discord_http_request_duration_seconds_count{{route="{route}"}} {metrics.latency.count}')
+        lines.append("# TYPE discord_http_responses_total counter")
+        for route, metrics in routes:
+            for status, count in sorted(metrics.statuses.items()):
+                lines.append(f'discord_http_responses_total{{route="{route}",status="{status}"}} {count}')
+        lines.append("# TYPE discord_http_ratelimits_total counter")
+        for route, metrics in routes:
+            lines.append(f'discord_http_ratelimits_total{{route="{route}",scope="global"}} {metrics.global_limits}')
+            lines.append(f'discord_http_ratelimits_total{{route="{route}",scope="bucket"}} {metrics.bucket_limits}')
+        lines.append("# TYPE discord_http_errors_total counter")
+        for route, metrics in routes:
+            lines.append(f'discord_http_errors_total{{route="{route}"}} {metrics.errors}')
+        lines.append("# TYPE discord_http_global_lock_wait_seconds histogram")
+        for bound, count in self.lock_wait.cumulative():
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f'discord_http_global_lock_wait_seconds_bucket{{le="{le}"}} {count}')
+        lines.append(f"discord_http_global_lock_wait_seconds_sum {self.lock_wait.sum:.6f}")
+        lines.append(f"discord_http_global_lock_wait_seconds_count {self.lock_wait.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """
+        Reset all metrics.
+        """
+        self.routes.clear()
+        self.lock_wait = Histogram()
+        self.started_at = time.monotonic()
@@ -0,0 +1,192 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import contextlib
+import enum
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterator
+
+from interactions.api.http.route import Route
+
+if TYPE_CHECKING:
+    from .http import ModifiedHTTPClient
+
+__all__ = ("Priority", "RequestScheduler", "request_priority")
+
+
+class Priority(enum.IntEnum):
+    """
+    The priority classes of the requests, a lower value is sent first.
+    """
+
+    INTERACTION = 0  # interaction callbacks and followups, which have a 3 seconds deadline
+    USER = 1  # requests a user is waiting for, e.g. sending a message
+    BACKGROUND = 2  # maintenance work nobody is waiting for
+
+
+_priority: ContextVar[Priority] = ContextVar("request_priority", default=Priority.USER)
+
+# the interaction callback and the webhook routes of the interaction token
+INTERACTION_PATHS = ("/interactions/", "/webhooks/{application_id}/")
+
+
+@contextlib.contextmanager
+def request_priority(priority: Priority) -> Iterator[None]:
+    """
+    Send the requests made in this context, and in the tasks created from it, with a priority.
+
+    :param priority: The priority of the requests.
+    :type priority: Priority
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RequestScheduler:
+    """
+    Holds back the requests of lower priorities while the route bucket or the global rate limit is contended.
+    A part of the global limit is reserved for the higher priorities, and a request waits for the waiting requests
+    of higher priorities. Background requests also wait for the interaction callbacks in flight, which are never
+    held back themselves.
+    """
+
+    def __init__(
+        self,
+        http: "ModifiedHTTPClient",
+        user_reserve: int = 5,
+        background_reserve: int = 15,
+        max_wait: float = 10,
+    ) -> None:
+        """
+        Initialize the scheduler.
+
+        :param http: The HTTP client.
+        :type http: ModifiedHTTPClient
+        :param user_reserve: The requests per second of the global limit that only interaction callbacks may use.
+        :type user_reserve: int
+        :param background_reserve: The requests per second of the global limit that background requests may not use.
+        :type background_reserve: int
+        :param max_wait: The maximum time in seconds a request is held back, so that it is not starved.
+        :type max_wait: float
+        """
+        self.http = http
+        self.reserves = {Priority.INTERACTION: 0, Priority.USER: user_reserve, Priority.BACKGROUND: background_reserve}
+        self.max_wait = max_wait
+        self.waiting: Counter[Priority] = Counter()
+        self.in_flight: Counter[Priority] = Counter()
+        self.held: Counter[Priority] = Counter()
+        self._wake = asyncio.Event()
+
+    @staticmethod
+    def priority_of(route: Route) -> Priority:
+        """
+        Get the priority of a request from its route and the current context.
+
+        :param route: The route to request.
+        :type route: Route
+
+        :return: The priority.
+        :rtype: Priority
+        """
+        if route.path.startswith(INTERACTION_PATHS):
+            return Priority.INTERACTION
+        return _priority.get()
+
+    def contended(self, route: Route, priority: Priority) -> bool:
+        """
+        Check whether a request should be held back.
+
+        :param route: The route to request.
+        :type route: Route
+        :param priority: The priority of the request.
+        :type priority: Priority
+
+        :return: Whether the request should wait.
+        :rtype: bool
+        """
+        if priority == Priority.INTERACTION:
+            return False
+        if any(self.waiting[i] for i in Priority if i < priority):
+            return True
+        if priority == Priority.BACKGROUND and self.in_flight[Priority.INTERACTION]:
+            return True
+        lock = self.http.global_lock
+        remaining = lock._calls if lock._reset_time > time.perf_counter() else lock.max_requests
+        if remaining <= self.reserves[priority]:
+            return True
+        # the bucket is exhausted or waiting for its reset, the requests queued in it are sent in order
+        bucket = self.http.ratelimit_locks.get(self.http._endpoints.get(route.rl_bucket))
+        return bucket is not None and bucket.locked
+
+    def _notify(self) -> None:
+        self._wake.set()
+        self._wake = asyncio.Event()
+
+    async def _wait(self, route: Route, priority: Priority) -> None:
+        self.waiting[priority] += 1
+        self.held[priority] += 1
+        deadline = time.monotonic() + self.max_wait
+        try:
+            while self.contended(route, priority) and time.monotonic() < deadline:
+                # the global limit resets every second, so do not sleep past the next window
+                lock = self.http.global_lock
+                timeout = min(max(lock._reset_time - time.perf_counter(), 0.05), 0.25)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.waiting[priority] -= 1
+            self._notify()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, route: Route, priority: Priority) -> AsyncIterator[None]:
+        """
+        Wait until a request may be sent, and keep track of it while it is in flight.
+
+        :param route: The route to request.
+        :type route: Route
+        :param priority: The priority of the request.
+        :type priority: Priority
+        """
+        if self.contended(route, priority):
+            await self._wait(route, priority)
+        self.in_flight[priority] += 1
+        try:
+            yield
+        finally:
+            self.in_flight[priority] -= 1
+            self._notify()
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Get the counters of the scheduler.
+
+        :return: The waiting and in-flight requests, and the requests that were held back, by priority.
+        :rtype: Dict[str, Dict[str, int]]
+        """
+        return {
+            i.name.lower(): {"waiting": self.waiting[i], "in_flight": self.in_flight[i], "held": self.held[i]}
+            for i in Priority
+        }
@@ -15,13 +15,28 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from typing import Any, Iterable, List, Protocol, TypeVar, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Protocol,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 import interactions
 from interactions.api.http.route import Route
 from interactions.models.internal.protocols import CanRequest as CanRequestBase
 from scyllapy import PreparedQuery, Query, QueryResult
 
+if TYPE_CHECKING:
+    from .database.cache import TTLCache
+    from .database.migrations import Migration
+    from .database.registry import DvcRegistry
+
 __all__ = ("CanRequest", "CanExecute")
 
 T_co = TypeVar("T_co", covariant=True)
@@ -46,7 +61,10 @@ class CanRequest(CanRequestBase):
 
 
 class CanExecute(Protocol[T_co]):
-    setup_queries: List[str]
+    migrations: List["Migration"]
+    queries: Dict[str, Tuple[str, str]]  # name: (statement, execution profile)
+    settings_cache: "TTLCache"
+    dvc_registry: "DvcRegistry"
 
     async def execute(
         self,
@@ -56,3 +74,19 @@ class CanExecute(Protocol[T_co]):
         paged: bool = False,
     ) -> Union[QueryResult, Any]:
         raise NotImplementedError("Derived classes need to implement this.")
+
+    async def execute_prepared(
+        self,
+        name: str,
+        params: Iterable[Any] | dict[str, Any] | None = None,
+        *,
+        paged: bool = False,
+    ) -> Union[QueryResult, Any]:
+        raise NotImplementedError("Derived classes need to implement this.")
+
+    async def execute_batch(
+        self,
+        names: List[str],
+        params: List[Iterable[Any] | dict[str, Any]],
+    ) -> QueryResult:
+        raise NotImplementedError("Derived classes need to implement this.")
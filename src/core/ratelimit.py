@@ -0,0 +1,134 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import dataclasses
+import time
+from typing import Dict, Mapping, Optional, Tuple
+
+from interactions.api.http.route import Route
+
+__all__ = ("BucketState", "RateLimitPredictor")
+
+
+@dataclasses.dataclass
+class BucketState:
+    """
+    The local model of a route bucket, the tokens are refilled to the limit when the bucket resets.
+    """
+
+    limit: int
+    remaining: int
+    reset_at: float  # time.monotonic() based
+
+
+class RateLimitPredictor:
+    """
+    Predicts whether a request would hit a route bucket limit, using the `X-RateLimit-*` headers of earlier responses.
+    Every allowed request takes a token locally, so concurrent requests cannot all pass on the last token.
+    """
+
+    def __init__(self, max_buckets: int = 4096) -> None:
+        """
+        Initialize the predictor.
+
+        :param max_buckets: The number of buckets to keep before the buckets that have reset are pruned.
+        :type max_buckets: int
+        """
+        self.max_buckets = max_buckets
+        self._hashes: Dict[str, str] = {}
+        self._buckets: Dict[Tuple[str, str], BucketState] = {}
+        self.predicted = 0
+
+    def _key(self, route: Route) -> Tuple[str, str]:
+        # buckets with the same hash are still separate for different major parameters
+        major = f"{route.channel_id}:{route.guild_id}:{route.webhook_id}"
+        return self._hashes.get(route.endpoint, route.endpoint), major
+
+    def acquire(self, route: Route) -> float:
+        """
+        Take a token from the bucket of a route.
+
+        :param route: The route to request.
+        :type route: Route
+
+        :return: 0 if the request may be sent, otherwise the predicted time in seconds until the bucket resets.
+        :rtype: float
+        """
+        state = self._buckets.get(self._key(route))
+        if state is None:
+            return 0
+        now = time.monotonic()
+        if now >= state.reset_at:
+            state.remaining = state.limit
+            # the real reset time is unknown until the next response, keep the window open meanwhile
+            state.reset_at = float("inf")
+        if state.remaining > 0:
+            state.remaining -= 1
+            return 0
+        if state.reset_at == float("inf"):
+            return 0
+        self.predicted += 1
+        return state.reset_at - now
+
+    def update(self, route: Route, headers: Mapping[str, str]) -> None:
+        """
+        Update the bucket of a route from the headers of a response.
+
+        :param route: The requested route.
+        :type route: Route
+        :param headers: The response headers.
+        :type headers: Mapping[str, str]
+        """
+        if (bucket := headers.get("x-ratelimit-bucket")) is not None:
+            self._hashes[route.endpoint] = bucket
+        try:
+            limit = int(headers["x-ratelimit-limit"])
+            remaining = int(headers["x-ratelimit-remaining"])
+            reset_at = time.monotonic() + float(headers["x-ratelimit-reset-after"])
+        except (KeyError, ValueError):
+            return
+
+        key = self._key(route)
+        state = self._buckets.get(key)
+        if state is None or reset_at > state.reset_at + 0.5 or state.reset_at == float("inf"):
+            self._buckets[key] = BucketState(limit, remaining, reset_at)
+            if len(self._buckets) > self.max_buckets:
+                self.prune()
+        else:
+            # still the same window, the tokens taken by requests in flight are not in the header yet
+            state.limit = limit
+            state.remaining = min(state.remaining, remaining)
+            state.reset_at = reset_at
+
+    def get(self, route: Route) -> Optional[BucketState]:
+        """
+        Get the bucket state of a route.
+
+        :param route: The route.
+        :type route: Route
+
+        :return: The bucket state, or None if the route has not been seen yet.
+        :rtype: Optional[BucketState]
+        """
+        return self._buckets.get(self._key(route))
+
+    def prune(self) -> None:
+        """
+        Remove the buckets that have reset, they would be refilled on the next request anyway.
+        """
+        now = time.monotonic()
+        self._buckets = {k: v for k, v in self._buckets.items() if v.reset_at > now}
@@ -0,0 +1,125 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import random
+import time
+from typing import Dict, Iterable, Optional
+
+__all__ = ("RetryPolicy",)
+
+
+class RetryPolicy:
+    """
+    Decides whether and when a failed request is retried, using exponential backoff with full jitter.
+    A single policy is shared by the callers, so its counters cover all of their retries.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 1,
+        max_delay: float = 30,
+        max_elapsed: float = 60,
+        statuses: Iterable[int] = (500, 502, 503, 504),
+    ) -> None:
+        """
+        Initialize the retry policy.
+
+        :param max_attempts: The maximum number of attempts, including the first one.
+        :type max_attempts: int
+        :param base_delay: The backoff ceiling in seconds of the first retry, it doubles on every retry.
+        :type base_delay: float
+        :param max_delay: The maximum backoff in seconds of a single retry.
+        :type max_delay: float
+        :param max_elapsed: The maximum time in seconds from the first attempt, no retry is made past it.
+        :type max_elapsed: float
+        :param statuses: The response statuses that are retried.
+        :type statuses: Iterable[int]
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_elapsed = max_elapsed
+        self.statuses = frozenset(statuses)
+        self.retries = 0
+        self.failures = 0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Get the delay before the next attempt.
+
+        :param attempt: The number of the failed attempt, starting from 0.
+        :type attempt: int
+        :param retry_after: The delay in seconds the server asked for, if any.
+        :type retry_after: Optional[float]
+
+        :return: The delay in seconds.
+        :rtype: float
+        """
+        # full jitter, so the callers that failed together do not retry together
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def backoff(self, attempt: int, started_at: float, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        Get the delay before retrying a failed attempt.
+        Returning None means the request has failed for good, and it is counted as a failure.
+
+        :param attempt: The number of the failed attempt, starting from 0.
+        :type attempt: int
+        :param started_at: The time.monotonic() of the first attempt.
+        :type started_at: float
+        :param retry_after: The delay in seconds the server asked for, if any.
+        :type retry_after: Optional[float]
+
+        :return: The delay in seconds, or None if the request should not be retried.
+        :rtype: Optional[float]
+        """
+        delay = self.delay(attempt, retry_after)
+        if attempt + 1 >= self.max_attempts or time.monotonic() - started_at + delay > self.max_elapsed:
+            self.failures += 1
+            return None
+        self.retries += 1
+        return delay
+
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """
+        Parse a Retry-After header given in seconds.
+
+        :param value: The header value.
+        :type value: Optional[str]
+
+        :return: The delay in seconds, or None if the header is missing or not in seconds.
+        :rtype: Optional[float]
+        """
+        try:
+            return max(float(value), 0) if value is not None else None
+        except ValueError:
+            return None
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the counters of the retry policy.
+
+        :return: The retries made and the requests that failed after retrying.
+        :rtype: Dict[str, int]
+        """
+        return {"retries": self.retries, "failures": self.failures}
@@ -16,6 +16,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import glob
+import io
 import re
 from functools import lru_cache
 from typing import List, Literal, Optional, Tuple
@@ -143,6 +144,7 @@ class DeveloperComponents(BaseExtension):
     developer_regex = re.compile(r"(\d+):developer:select")
     eval_completed_regex = re.compile(r"(\d+):developer:eval:completed")
     extensions_regex = re.compile(r"(\d+):developer:extensions")
+    http_regex = re.compile(r"(\d+):developer:http")
 
     @staticmethod
     def developer(author_id: int) -> List[interactions.ActionRow]:
@@ -170,6 +172,12 @@ class DeveloperComponents(BaseExtension):
                         value="eval",
                         emoji="💻",
                     ),
+                    interactions.StringSelectOption(
+                        label="HTTP統計",
+                        description="查看各個Discord API路由的延遲及速率限制",
+                        value="http",
+                        emoji="📊",
+                    ),
                     interactions.StringSelectOption(
                         label="關閉機器人",
                         description="中斷機器人與Discord和資料庫的連接並停止伺服器",
@@ -215,6 +223,11 @@ class DeveloperComponents(BaseExtension):
                 embed=Embed("管理機器人插件的各項功能。"),
                 components=DeveloperComponents.extensions(author_id),
             )
+        elif option == "http":
+            await ctx.edit_origin(
+                embed=DeveloperCore.http_embed(self.client),
+                components=DeveloperComponents.http(author_id),
+            )
         elif option == "shutdown":
             await ctx.edit_origin(
                 embed=Embed("即將關閉機器人。", success=True),
@@ -267,6 +280,69 @@ class DeveloperComponents(BaseExtension):
                 embed=DeveloperCore.developer_embed(), components=DeveloperComponents.developer(author_id)
             )
 
+    @staticmethod
+    def http(author_id: int) -> List[interactions.ActionRow]:
+        """
+        The components for the HTTP metrics.
+        """
+        return [
+            interactions.ActionRow(
+                interactions.StringSelectMenu(
+                    interactions.StringSelectOption(
+                        label="NekoOS • HTTP統計",
+                        value="placeholder",
+                        emoji="📊",
+                        default=True,
+                    ),
+                    interactions.StringSelectOption(
+                        label="重新整理",
+                        description="取得最新的統計數據",
+                        value="refresh",
+                        emoji="🔄",
+                    ),
+                    interactions.StringSelectOption(
+                        label="匯出",
+                        description="以Prometheus格式匯出全部統計數據",
+                        value="export",
+                        emoji="📤",
+                    ),
+                    interactions.StringSelectOption(
+                        label="重設",
+                        description="清除全部統計數據",
+                        value="reset",
+                        emoji="🗑️",
+                    ),
+                    interactions.StringSelectOption(
+                        label="返回",
+                        description="回到全部開發者工具",
+                        value="back",
+                        emoji="🔙",
+                    ),
+                    custom_id=f"{author_id}:developer:http",
+                )
+            )
+        ]
+
+    @interactions.component_callback(http_regex)
+    async def http_callback(self, ctx: interactions.ComponentContext):
+        author_id = int(self.http_regex.match(ctx.custom_id).group(1))
+        if ctx.author.id != author_id:
+            return await ctx.respond(embed=Embed.declined("select"), ephemeral=True)
+        option = ctx.values[0]
+        await ctx.defer(edit_origin=True)
+        if option == "back":
+            return await ctx.edit(
+                embed=DeveloperCore.developer_embed(), components=DeveloperComponents.developer(author_id)
+            )
+        if option == "reset":
+            self.client.http.metrics.reset()
+        file = None
+        if option == "export":
+            file = interactions.File(io.BytesIO(self.client.http.metrics.export().encode()), file_name="http.prom")
+        await ctx.edit(
+            embed=DeveloperCore.http_embed(self.client), components=DeveloperComponents.http(author_id), file=file
+        )
+
     @staticmethod
     def extensions(author_id: int, skip_list: Optional[bool] = False) -> List[interactions.ActionRow]:
         """
@@ -388,6 +464,38 @@ class DeveloperCore(BaseExtension):
         """
         return Embed("僅限機器人開發者使用的功能")
 
+    @staticmethod
+    def http_embed(client: Client) -> Embed:
+        """
+        The embed for the HTTP metrics, showing the routes with the most requests.
+        """
+        metrics = client.http.metrics.snapshot()
+        embed = Embed(f"過去 {metrics['uptime'] / 60:.0f} 分鐘內的Discord API請求統計")
+        routes = sorted(metrics["routes"].items(), key=lambda i: i[1]["count"], reverse=True)[:8]
+        if not routes:
+            value = "\\*沒有請求\\*"
+        else:
+            lines = []
+            for name, i in routes:
+                line = (
+                    f"{name[:100]}\n  {i['count']}次 p50 {i['p50'] * 1000:.0f}ms p95 {i['p95'] * 1000:.0f}ms"
+                    f" 429 {i['global_limits']}/{i['bucket_limits']} 錯誤 {i['errors']}"
+                )
+                # an embed field holds at most 1024 characters, including the code block
+                if len("\n".join([*lines, line])) > 1016:
+                    break
+                lines.append(line)
+            value = "\n".join(lines)
+            value = f"```\n{value}\n```"
+        embed.add_field(name="路由 (429: 全域/路由)", value=value, pre=True)
+        lock = metrics["lock_wait"]
+        embed.add_field(
+            name="全域速率限制等待",
+            value=f"{lock['count']}次請求，共 {lock['total']:.2f} 秒\n"
+            f"p95 {lock['p95'] * 1000:.0f}ms 最長 {lock['max']:.2f} 秒",
+        )
+        return embed
+
     @prefixed_commands.prefixed_command(name="developer", aliases=["dev", "owner", "help"])
     @interactions.check(interactions.is_owner())
     async def developer(self, ctx: prefixed_commands.PrefixedContext):
@@ -16,9 +16,12 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import ast
+import asyncio
+import dataclasses
 import math
 import operator as op
-from typing import List, Tuple
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
 
 import interactions
 from interactions.api.events import MessageCreate
@@ -27,9 +30,9 @@ from src.main import BaseExtension, Client
 from src.utils import CountingSettings, Embed, GuildFunSettings
 
 
-class Counting(BaseExtension):
+class ExpressionEvaluator:
     """
-    The extension class for the counting game.
+    A bounded-cost evaluator for the arithmetic expressions of the counting game.
     """
 
     operators = {
@@ -44,55 +47,300 @@ class Counting(BaseExtension):
         ast.FloorDiv: op.floordiv,
     }
 
-    def eval_expr(self, expr):
-        return self._eval_expr(ast.parse(expr, mode="eval").body)
+    def __init__(
+        self,
+        max_nodes: int = 64,
+        max_bits: int = 1024,
+        max_exponent: int = 256,
+        thread_threshold: int = 24,
+        timeout: float = 1.0,
+        cache_size: int = 1024,
+    ) -> None:
+        """
+        Initialize the evaluator.
+
+        :param max_nodes: The maximum number of AST nodes in an expression.
+        :type max_nodes: int
+        :param max_bits: The maximum bit-length of an operand or an intermediate result.
+        :type max_bits: int
+        :param max_exponent: The maximum absolute value of an exponent.
+        :type max_exponent: int
+        :param thread_threshold: The number of nodes above which an expression is evaluated in a worker thread.
+        :type thread_threshold: int
+        :param timeout: The timeout in seconds of an evaluation in a worker thread.
+        :type timeout: float
+        :param cache_size: The maximum number of parsed expressions to cache.
+        :type cache_size: int
+        """
+        self.max_nodes = max_nodes
+        self.max_bits = max_bits
+        self.max_exponent = max_exponent
+        self.thread_threshold = thread_threshold
+        self.timeout = timeout
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+
+    def _parse(self, expr: str) -> Tuple[ast.expr, bool]:
+        """
+        Parse an expression and check its size.
+        This is an internal method, use the cached `parse` instead.
+
+        :param expr: The expression.
+        :type expr: str
 
-    def _eval_expr(self, node):
-        if isinstance(node, ast.Constant):
-            return node.n
-        elif isinstance(node, ast.BinOp):
-            return self.operators[type(node.op)](self._eval_expr(node.left), self._eval_expr(node.right))
-        elif isinstance(node, ast.UnaryOp):
-            return self.operators[type(node.op)](self._eval_expr(node.operand))
+        :raises SyntaxError: Raised when the expression is invalid.
+        :raises ValueError: Raised when the expression has too many nodes.
+
+        :return: The parsed expression, and whether it should be evaluated in a worker thread.
+        :rtype: Tuple[ast.expr, bool]
+        """
+        body = ast.parse(expr, mode="eval").body
+        nodes = list(ast.walk(body))
+        if len(nodes) > self.max_nodes:
+            raise ValueError("The expression is too complex.")
+        heavy = len(nodes) > self.thread_threshold or any(isinstance(i, ast.Pow) for i in nodes)
+        return body, heavy
+
+    async def evaluate(self, expr: str) -> Union[int, float]:
+        """
+        Evaluate an expression.
+        Complex expressions are evaluated in a worker thread with a timeout, so they never block the event loop.
+
+        :param expr: The expression.
+        :type expr: str
+
+        :raises SyntaxError: Raised when the expression is invalid.
+        :raises TypeError: Raised when the expression contains unsupported syntax.
+        :raises ValueError: Raised when the expression exceeds the limits.
+        :raises asyncio.TimeoutError: Raised when the evaluation takes too long.
+
+        :return: The value of the expression.
+        :rtype: Union[int, float]
+        """
+        body, heavy = self.parse(expr)
+        if not heavy:
+            return self._eval(body)
+        return await asyncio.wait_for(asyncio.to_thread(self._eval, body), self.timeout)
+
+    def _bits(self, value: Union[int, float]) -> int:
+        """
+        Get the bit-length of a value, floats are bounded by themselves and count as zero.
+        """
+        return value.bit_length() if isinstance(value, int) else 0
+
+    def _check(self, node: ast.operator, left: Union[int, float], right: Union[int, float]) -> None:
+        """
+        Check that an operation stays within the limits before it is computed.
+
+        :raises ValueError: Raised when the operation exceeds the limits.
+        """
+        if isinstance(node, ast.Mult) and self._bits(left) + self._bits(right) > self.max_bits:
+            raise ValueError("The product is too large.")
+        if isinstance(node, ast.Pow):
+            if abs(right) > self.max_exponent:
+                raise ValueError("The exponent is too large.")
+            if isinstance(right, int) and self._bits(left) * abs(right) > self.max_bits:
+                raise ValueError("The power is too large.")
+
+    def _eval(self, node: ast.expr) -> Union[int, float]:
+        """
+        Evaluate a parsed expression.
+        This is an internal method, use `evaluate` instead.
+        """
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            result = node.value
+        elif isinstance(node, ast.BinOp) and type(node.op) in self.operators:
+            left, right = self._eval(node.left), self._eval(node.right)
+            self._check(node.op, left, right)
+            result = self.operators[type(node.op)](left, right)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            result = -self._eval(node.operand)
         else:
             raise TypeError(node)
+        if not isinstance(result, (int, float)):
+            raise TypeError(result)
+        if self._bits(result) > self.max_bits:
+            raise ValueError("The value is too large.")
+        return result
+
+
+@dataclasses.dataclass
+class CountingState:
+    """
+    The in-memory state of the counting game in a channel.
+    """
+
+    guild_id: int
+    current: int
+    previous: int
+    max: int
+    dirty: bool = False
+    queue: asyncio.PriorityQueue = dataclasses.field(default_factory=asyncio.PriorityQueue)
+    worker: Optional[asyncio.Task] = None
+
+
+class Counting(BaseExtension):
+    """
+    The extension class for the counting game.
+    """
+
+    def __init__(self, client: Client):
+        """
+        The constructor for the extension.
+
+        :param client: The client object.
+        :type client: Client
+        """
+        super().__init__(client=client)
+        self.states: Dict[int, CountingState] = {}
+        self.checkpoint_interval = self.global_config.get("counting.checkpoint_interval", 5)
+        self.checkpoint_task = asyncio.create_task(self.checkpoint_loop())
+        self.evaluator = ExpressionEvaluator()
+
+    async def checkpoint_loop(self) -> None:
+        """
+        Periodically save the dirty counting states to the database.
+        """
+        await self.database.wait_until_ready()
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self.checkpoint()
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception("Failed to checkpoint the counting states.")
+
+    async def checkpoint(self, channel_id: Optional[int] = None) -> None:
+        """
+        Save the dirty counting states to the database.
+
+        :param channel_id: Only save the state of this channel.
+        :type channel_id: Optional[int]
+        """
+        if channel_id is None:
+            states = list(self.states.values())
+        else:
+            states = [self.states[channel_id]] if channel_id in self.states else []
+        for state in [i for i in states if i.dirty]:
+            state.dirty = False
+            try:
+                await self.database.checkpoint_counting(state.guild_id, state.current, state.previous, state.max)
+            except Exception:
+                state.dirty = True
+                raise
+
+    async def drop_guild_state(self, guild_id: int, save: bool = True) -> None:
+        """
+        Forget the in-memory counting state of a guild.
+        This must be called around changes to the counting settings of the guild.
+
+        :param guild_id: The guild ID.
+        :type guild_id: int
+        :param save: Whether to save the state to the database first.
+        :type save: bool
+        """
+        for channel_id, state in [(k, v) for k, v in self.states.items() if v.guild_id == guild_id]:
+            if state.worker and not state.worker.done():
+                await state.worker
+            if save:
+                await self.checkpoint(channel_id)
+            self.states.pop(channel_id, None)
+
+    async def close(self) -> None:
+        """
+        Process the queued messages and save the final counting states.
+        """
+        self.checkpoint_task.cancel()
+        workers = [i.worker for i in self.states.values() if i.worker and not i.worker.done()]
+        await asyncio.gather(*workers, return_exceptions=True)
+        await self.checkpoint()
+
+    def drop(self) -> None:
+        self.checkpoint_task.cancel()
+        super().drop()
 
     @interactions.listen()
     async def on_message_create(self, event: MessageCreate):
         if not event.message.content or (event.message.author and event.message.author.bot) or not event.message.guild:
             return
-        counting = await self.database.get_guild_counting(event.message.guild.id)
-        if not counting.enabled or counting.channel != event.message.channel.id:
-            return
         if any(i not in "0123456789+-*/^.÷x%" for i in event.message.content):
             return
-        content = event.message.content.replace("÷", "/").replace("x", "*")
+        channel_id = int(event.message.channel.id)
+        counting = await self.database.get_guild_counting(event.message.guild.id)
+        if not counting.enabled or counting.channel != channel_id:
+            return
+        if (state := self.states.get(channel_id)) is None:
+            state = self.states.setdefault(
+                channel_id,
+                CountingState(int(event.message.guild.id), counting.current, counting.previous, counting.max),
+            )
+        state.queue.put_nowait((int(event.message.id), event.message))
+        if state.worker is None or state.worker.done():
+            state.worker = asyncio.create_task(self.process_queue(state))
+
+    async def process_queue(self, state: CountingState) -> None:
+        """
+        Process the queued messages of a counting channel one by one, in snowflake order.
+
+        :param state: The state of the counting channel.
+        :type state: CountingState
+        """
+        while not state.queue.empty():
+            _, message = state.queue.get_nowait()
+            try:
+                await self.process_message(state, message)
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception(f"Failed to process counting message {message.id}.")
+
+    async def process_message(self, state: CountingState, message: interactions.Message) -> None:
+        """
+        Process a message in a counting channel.
+
+        :param state: The state of the counting channel.
+        :type state: CountingState
+        :param message: The message.
+        :type message: interactions.Message
+        """
+        content = message.content.replace("÷", "/").replace("x", "*")
         try:
-            value = math.trunc(self.eval_expr(content))
-        except (TypeError, ZeroDivisionError):
+            value = math.trunc(await self.evaluator.evaluate(content))
+        except (SyntaxError, TypeError, ValueError, ZeroDivisionError, OverflowError, asyncio.TimeoutError):
             return
-        if counting.current != 0 and counting.previous == event.message.author.id:
-            await event.message.add_reaction("❌")
-            await event.message.reply(embed=Embed("你不能連續數兩次！", success=False))
-            await self.database.reset_current_count(event.message.guild.id, counting.current)
-        elif round(value) != counting.current + 1:
-            await event.message.add_reaction("❌")
-            if counting.current == 0:
-                await event.message.reply(embed=Embed("你需要從`1`開始數！", success=False))
+        if state.current != 0 and state.previous == message.author.id:
+            self.reset_count(state)
+            await message.add_reaction("❌")
+            await message.reply(embed=Embed("你不能連續數兩次！", success=False))
+        elif round(value) != state.current + 1:
+            current = state.current
+            if current != 0:
+                self.reset_count(state)
+            await message.add_reaction("❌")
+            if current == 0:
+                await message.reply(embed=Embed("你需要從`1`開始數！", success=False))
             else:
-                await event.message.reply(
-                    embed=Embed(f"下個數字是`{counting.current + 1}`才對！\n請從`1`重新開始！", success=False)
-                )
-                await self.database.reset_current_count(event.message.guild.id, counting.current)
+                await message.reply(embed=Embed(f"下個數字是`{current + 1}`才對！\n請從`1`重新開始！", success=False))
         else:
-            if (counting.current + 1) == 100:
+            state.current += 1
+            state.previous = int(message.author.id)
+            state.dirty = True
+            if state.current == 100:
                 emoji = "💯"
-            elif (counting.current + 1) % 100 == 0:
+            elif state.current % 100 == 0:
                 emoji = "🎉"
             else:
                 emoji = "✅"
-            await event.message.add_reaction(emoji)
-            await self.database.inc_current_count(event.message.guild.id, event.message.author.id)
+            await message.add_reaction(emoji)
+
+    @staticmethod
+    def reset_count(state: CountingState) -> None:
+        """
+        Reset the current count of a counting channel.
+
+        :param state: The state of the counting channel.
+        :type state: CountingState
+        """
+        state.max = max(state.max, state.current)
+        state.current = 0
+        state.previous = -1
+        state.dirty = True
 
     async def handle_enabled(self, ctx: interactions.ComponentContext) -> Tuple[Embed, List[interactions.ActionRow]]:
         """
@@ -104,12 +352,16 @@ class Counting(BaseExtension):
         :return: The embed and components.
         :rtype: tuple
         """
+        await self.drop_guild_state(int(ctx.guild.id))
+        # the settings are written back, so they must not come from a cache older than the last checkpoint
+        self.database.invalidate_guild_counting(ctx.guild.id)
         counting = await self.database.get_guild_counting(ctx.guild.id)
         if counting.enabled:
             counting.enabled = False
             counting.previous = -1
             counting.current = 0
             await self.database.set_guild_counting(ctx.guild.id, counting)
+            await self.drop_guild_state(int(ctx.guild.id), save=False)
             return CountingSettings.embed(ctx, counting, "成功停用數數字遊戲。", True), CountingSettings.components(
                 counting
             )
@@ -119,6 +371,7 @@ class Counting(BaseExtension):
             )
         counting.enabled = True
         await self.database.set_guild_counting(ctx.guild.id, counting)
+        await self.drop_guild_state(int(ctx.guild.id), save=False)
         await c.send(embed=Embed("數數字遊戲開始！\n請從`1`開始數數字～", success=True))
         return CountingSettings.embed(ctx, counting, "成功啟用數數字遊戲。", True), CountingSettings.components(
             counting
@@ -169,6 +422,7 @@ class Counting(BaseExtension):
         The component callback for the counting channel select menu.
         """
         await ctx.defer(edit_origin=True)
+        self.database.invalidate_guild_counting(ctx.guild.id)
         counting = await self.database.get_guild_counting(ctx.guild.id)
         if counting.enabled and counting.channel != -1 and ctx.guild.get_channel(counting.channel) is not None:
             embed = CountingSettings.embed(ctx, counting, "請先停用數數字遊戲。", False)
@@ -176,6 +430,7 @@ class Counting(BaseExtension):
             counting.channel = ctx.values[0].id
             counting.enabled = False
             await self.database.set_guild_counting(ctx.guild.id, counting)
+            await self.drop_guild_state(int(ctx.guild.id), save=False)
             embed = CountingSettings.embed(ctx, counting, "成功設置遊戲頻道。", True)
         components = CountingSettings.components(counting)
         await ctx.edit(embed=embed, components=components)
@@ -17,14 +17,22 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import asyncio
 import re
-from typing import List, Tuple
+import time
+from typing import List, Optional, Tuple
 
 import interactions
 from interactions import MISSING, TYPE_ALL_CHANNEL, Absent
 from interactions.api.events import ChannelDelete, VoiceStateUpdate
 
+from src.core import ChannelEditQueue, Priority, request_priority
 from src.main import BaseExtension, Client
-from src.utils import DvcPanel, DvcSettings, Embed, GuildGeneralSettings, Ratelimited
+from src.utils import (
+    DeadlineScheduler,
+    DvcPanel,
+    DvcSettings,
+    Embed,
+    GuildGeneralSettings,
+)
 
 
 class DvcModals(BaseExtension):
@@ -32,6 +40,31 @@ class DvcModals(BaseExtension):
     The extension class for the dynamic voice channel modals.
     """
 
+    def __init__(self, client: Client):
+        """
+        The constructor for the extension.
+
+        :param client: The client object.
+        :type client: Client
+        """
+        super().__init__(client=client)
+        self.edits = ChannelEditQueue(self.client.http, self.client.cache.place_channel_data, self.logger)
+
+    def drop(self) -> None:
+        self.edits.cancel()
+        super().drop()
+
+    @staticmethod
+    def applied_embed(apply_at: Optional[float], msg: str) -> Embed:
+        """
+        The response embed for an edit that was either applied or queued.
+        """
+        if apply_at is None:
+            return Embed(msg, True)
+        return Embed(
+            f"頻道設定變更過於頻繁，已排入佇列，將於 <t:{int(apply_at)}:T> (<t:{int(apply_at)}:R>) 套用。", True
+        )
+
     async def edit_channel(
         self,
         channel: "TYPE_ALL_CHANNEL",
@@ -41,9 +74,13 @@ class DvcModals(BaseExtension):
         user_limit: Absent[int] = MISSING,
         reason: Absent[str] = MISSING,
         **kwargs,
-    ) -> "TYPE_ALL_CHANNEL":
+    ) -> Optional[float]:
         """
-        Edits the channel but raises an exception on 429.
+        Edits the channel, or queues the edit if the channel has been edited too frequently.
+        Queued edits of the same channel are merged and applied together.
+
+        :return: None if the edit was applied, otherwise the UNIX timestamp it will be applied at.
+        :rtype: Optional[float]
         """
         payload = {
             "name": name,
@@ -51,13 +88,7 @@ class DvcModals(BaseExtension):
             "user_limit": user_limit,
             **kwargs,
         }
-        channel_data = await self.client.http.modify_channel_raise(channel.id, payload, reason)
-        if not channel_data:
-            raise Ratelimited(
-                "You have changed this channel too frequently, you need to wait a while before trying again."
-            ) from None
-
-        return self.client.cache.place_channel_data(channel_data)
+        return await self.edits.edit(channel.id, {k: v for k, v in payload.items() if v is not MISSING}, reason)
 
     @interactions.modal_callback("dvc_settings:name")
     async def name_modal(self, ctx: interactions.ModalContext, name: str, **_):
@@ -86,10 +117,10 @@ class DvcModals(BaseExtension):
         if not name.strip():
             return await ctx.send(embed=Embed("名稱不能為空。", False))
         try:
-            await self.edit_channel(ctx.channel, name=name, reason="動態語音頻道 - 修改名稱")
-        except Ratelimited:
-            return await ctx.send(embed=Embed("頻道設定變更過於頻繁，請稍後再試。", False))
-        await ctx.send(embed=Embed("成功修改語音頻道名稱。", True))
+            apply_at = await self.edit_channel(ctx.channel, name=name, reason="動態語音頻道 - 修改名稱")
+        except interactions.errors.HTTPException:
+            return await ctx.send(embed=Embed("無法修改語音頻道設定，請稍後再試。", False))
+        await ctx.send(embed=self.applied_embed(apply_at, "成功修改語音頻道名稱。"))
 
     @interactions.modal_callback("dvc_panel:bitrate")
     async def dvc_panel_bitrate(self, ctx: interactions.ModalContext, bitrate: str):
@@ -108,10 +139,10 @@ class DvcModals(BaseExtension):
         if not 8 <= bitrate <= max_bitrate:
             return await ctx.send(embed=Embed(f"位元率必須在 8-{max_bitrate}kbps 之間。", False))
         try:
-            await self.edit_channel(ctx.channel, bitrate=bitrate * 1000, reason="動態語音頻道 - 修改位元率")
-        except Ratelimited:
-            return await ctx.send(embed=Embed("頻道設定變更過於頻繁，請稍後再試。", False))
-        await ctx.send(embed=Embed("成功修改語音頻道位元率。", True))
+            apply_at = await self.edit_channel(ctx.channel, bitrate=bitrate * 1000, reason="動態語音頻道 - 修改位元率")
+        except interactions.errors.HTTPException:
+            return await ctx.send(embed=Embed("無法修改語音頻道設定，請稍後再試。", False))
+        await ctx.send(embed=self.applied_embed(apply_at, "成功修改語音頻道位元率。"))
 
     @interactions.modal_callback("dvc_panel:limit")
     async def dvc_panel_limit(self, ctx: interactions.ModalContext, limit: str):
@@ -129,10 +160,10 @@ class DvcModals(BaseExtension):
         if not 0 <= limit <= 99:
             return await ctx.send(embed=Embed("人數限制必須在 0-99 之間。", False))
         try:
-            await self.edit_channel(ctx.channel, user_limit=limit, reason="動態語音頻道 - 修改人數限制")
-        except Ratelimited:
-            return await ctx.send(embed=Embed("頻道設定變更過於頻繁，請稍後再試。", False))
-        await ctx.send(embed=Embed("成功修改語音頻道人數限制。", True))
+            apply_at = await self.edit_channel(ctx.channel, user_limit=limit, reason="動態語音頻道 - 修改人數限制")
+        except interactions.errors.HTTPException:
+            return await ctx.send(embed=Embed("無法修改語音頻道設定，請稍後再試。", False))
+        await ctx.send(embed=self.applied_embed(apply_at, "成功修改語音頻道人數限制。"))
 
 
 class DvcComponents(BaseExtension):
@@ -156,8 +187,14 @@ class DvcComponents(BaseExtension):
         if dvc.enabled:
             dvc.enabled = False
             await self.database.set_guild_dvc_settings(ctx.guild.id, dvc)
-            async for i in self.database.get_guild_dvcs(ctx.guild.id):
-                await self.client.http.delete_channel(i)
+            # the channels are deleted in the background, a channel is only forgotten once it is gone,
+            # so an interrupted job is picked up again at startup
+            self.client.bulk.delete_channels(
+                ("dvc", ctx.guild.id),
+                [i async for i in self.database.get_guild_dvcs(ctx.guild.id)],
+                "動態語音頻道停用",
+                self.database.remove_dvc,
+            )
             return DvcSettings.embed(ctx, dvc, "成功停用動態語音頻道。", True), DvcSettings.components(dvc)
         if dvc.lobby == -1 or not await self.client.fetch_channel(dvc.lobby):
             return DvcSettings.embed(ctx, dvc, "請先設置大廳頻道。", False), DvcSettings.components(dvc)
@@ -292,13 +329,84 @@ class DvcCore(BaseExtension):
         :type client: Client
         """
         super().__init__(client=client)
+        # empty channels are only deleted after a grace period, so a quick rejoin keeps the channel
+        self.grace_period = self.global_config.get("dvc.grace_period", 30)
+        self.deletions: DeadlineScheduler[int] = DeadlineScheduler(self.delete_if_empty)
         asyncio.create_task(self.async_init())
 
+    def drop(self) -> None:
+        self.deletions.close()
+        super().drop()
+
     async def async_init(self) -> None:
         await self.database.wait_until_ready()
-        async for channel_id in self.database.get_dvcs():
-            if not await self.client.fetch_channel(channel_id):
-                await self.database.remove_dvc(channel_id)
+        # the guilds and their channels are cached from GUILD_CREATE once the client is ready
+        await self.client.wait_until_ready()
+        with request_priority(Priority.BACKGROUND):
+            await self.reconcile()
+        # channels that were left empty while the bot was offline get a fresh grace period
+        for channel_id in self.database.dvc_registry:
+            if self.client.bulk.get(("dvc", self.database.dvc_registry.guild(channel_id))):
+                continue
+            channel = self.client.cache.get_channel(channel_id)
+            if channel and not channel.voice_members:
+                self.deletions.schedule(channel_id, self.grace_period)
+
+    async def delete_if_empty(self, channel_id: int) -> None:
+        """
+        Delete a dynamic voice channel if it is still empty.
+
+        :param channel_id: The channel ID.
+        :type channel_id: int
+        """
+        channel = self.client.cache.get_channel(channel_id)
+        if not channel or channel.voice_members or not await self.database.is_dvc(channel_id):
+            return
+        try:
+            with request_priority(Priority.BACKGROUND):
+                await channel.delete("動態語音頻道移除")
+        except interactions.errors.HTTPException as e:
+            self.logger.warning(f"Failed to delete dynamic voice channel {channel_id}: {e!r}")
+
+    async def reconcile(self) -> None:
+        """
+        Remove the dynamic voice channels that no longer exist.
+        Channels of cached guilds are checked against the cache, only the others are fetched.
+        Deleting the channels of a disabled guild is resumed if it was interrupted by a restart.
+        """
+        start = time.monotonic()
+        registry = self.database.dvc_registry
+        checked = len(registry)
+        orphans, unknown = [], []
+        for channel_id in registry:
+            if self.client.cache.get_guild(registry.guild(channel_id)) is None:
+                unknown.append(channel_id)
+            elif self.client.cache.get_channel(channel_id) is None:
+                orphans.append(channel_id)
+
+        semaphore = asyncio.Semaphore(self.global_config.get("dvc.reconcile_concurrency", 8))
+
+        async def check(channel_id: int) -> None:
+            async with semaphore:
+                try:
+                    if not await self.client.fetch_channel(channel_id):
+                        orphans.append(channel_id)
+                except interactions.errors.HTTPException as e:
+                    self.logger.warning(f"Failed to check dynamic voice channel {channel_id}: {e!r}")
+
+        await asyncio.gather(*(check(i) for i in unknown))
+        await self.database.remove_dvcs(orphans)
+        self.logger.info(
+            f"Reconciled dynamic voice channels: checked {checked}, "
+            f"removed {len(orphans)}, fetched {len(unknown)}, took {time.monotonic() - start:.2f}s."
+        )
+
+        # resume deleting the channels of guilds that disabled the feature before the bot was stopped
+        for guild_id in registry.guilds():
+            if not (await self.database.get_guild_dvc_settings(guild_id)).enabled:
+                self.client.bulk.delete_channels(
+                    ("dvc", guild_id), registry.channels(guild_id), "動態語音頻道停用", self.database.remove_dvc
+                )
 
     async def dvc_name(self, vs: interactions.VoiceState, ori: str) -> str:
         """
@@ -321,6 +429,10 @@ class DvcCore(BaseExtension):
         """
         The event that is triggered when a user updated their voice state.
         """
+        # someone joined an empty channel before its grace period ended
+        if event.after and event.after.channel:
+            self.deletions.cancel(event.after.channel.id)
+
         guild_conf = await self.database.get_guild_dvc_settings((event.after or event.before).guild.id)
         if not guild_conf.enabled:
             return
@@ -357,7 +469,10 @@ class DvcCore(BaseExtension):
             # the channel is a dynamic voice channel
             and await self.database.is_dvc(event.before.channel.id)
         ):
-            await event.before.channel.delete("動態語音頻道移除")
+            if self.grace_period > 0:
+                self.deletions.schedule(event.before.channel.id, self.grace_period)
+            else:
+                await event.before.channel.delete("動態語音頻道移除")
 
     @interactions.listen()
     async def on_channel_delete(self, event: ChannelDelete) -> None:
@@ -365,6 +480,7 @@ class DvcCore(BaseExtension):
         The event that is triggered when a channel is deleted.
         """
         if event.channel.type == interactions.ChannelType.GUILD_VOICE:
+            self.deletions.cancel(event.channel.id)
             await self.database.remove_dvc(event.channel.id)
 
 
@@ -15,14 +15,30 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import asyncio
+import codecs
 import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Set, Tuple
 
 import aiohttp
 import decouple
 import interactions
 
 from src.main import BaseExtension, Client
-from src.utils import Embed, GuildSafetySettings, MessageSafetySettings, Validator
+from src.utils import (
+    Embed,
+    FairQueue,
+    Finding,
+    GuildSafetySettings,
+    LookupBatcher,
+    MessageSafetySettings,
+    ThreatListDatabase,
+    Validator,
+    VerdictCache,
+    canonicalize_url,
+)
 
 
 class MessageSafety(BaseExtension):
@@ -30,17 +46,116 @@ class MessageSafety(BaseExtension):
     The extension class for the message safety features.
     """
 
-    async def _handle_tokens(self, event: interactions.events.MessageCreate) -> bool:
+    text_attachments = (".txt", ".log")
+
+    def __init__(self, client: Client):
+        """
+        The constructor for the extension.
+
+        :param client: The client object.
+        :type client: Client
+        """
+        super().__init__(client=client)
+        # a single pooled session for all Safe Browsing lookups, connections are kept alive and reused
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.global_config.get("safety.max_connections", 16),
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+            ),
+            timeout=aiohttp.ClientTimeout(total=10),
+        )
+        self.verdicts = VerdictCache(
+            self.global_config.get("safety.url_cache.size", 10000),
+            self.global_config.get("safety.url_cache.safe_ttl", 1800),
+            self.global_config.get("safety.url_cache.unsafe_ttl", 3600),
+        )
+        self.batcher = LookupBatcher(
+            self.lookup_urls,
+            self.global_config.get("safety.batch.window", 0.05),
+            min(self.global_config.get("safety.batch.max_size", 500), 500),
+        )
+        self.api_url = self.global_config.get(
+            "safety.threat_lists.api_url", "https://safebrowsing.googleapis.com/v4"
+        ).rstrip("/")
+        # a local copy of the threat lists, so only URLs with a matching hash prefix need a request
+        self.threat_lists: Optional[ThreatListDatabase] = None
+        self.sync_task: Optional[asyncio.Task] = None
+        if self.global_config.get("safety.threat_lists.enabled", False):
+            self.threat_lists = ThreatListDatabase(
+                self.global_config.get("safety.threat_lists.path", "data/safebrowsing"),
+                self.session,
+                decouple.config("googleapi"),
+                self.client.__version__,
+                self.api_url,
+            )
+            self.threat_lists.load()
+            self.sync_task = asyncio.create_task(self.sync_threat_lists())
+        # scans are queued and run by a fixed number of workers, so a flood of messages cannot pile up unbounded
+        self.queue: FairQueue[Tuple[interactions.events.MessageCreate, List[Finding]]] = FairQueue(
+            self.global_config.get("safety.queue.size", 1000)
+        )
+        self.overflow = self.global_config.get("safety.queue.overflow", "degrade")
+        if self.overflow not in ("drop", "degrade", "block"):
+            raise ValueError(f"Invalid safety queue overflow policy: {self.overflow}")
+        self.workers = [
+            asyncio.create_task(self.scan_worker()) for _ in range(self.global_config.get("safety.queue.workers", 4))
+        ]
+        self.attachment_max_size = self.global_config.get("safety.attachments.max_size", 8388608)
+        self.attachment_chunk_size = self.global_config.get("safety.attachments.chunk_size", 65536)
+        self.process_threshold = self.global_config.get("safety.attachments.process_threshold", 1048576)
+        self.process_block_size = self.global_config.get("safety.attachments.process_block_size", 262144)
+        # large attachments are searched in other processes, so they do not block the event loop,
+        # the workers are spawned since forking would copy the running event loop and open sockets
+        self.pool = ProcessPoolExecutor(
+            self.global_config.get("safety.attachments.processes", 2), mp_context=multiprocessing.get_context("spawn")
+        )
+
+    async def close(self) -> None:
+        """
+        Stop the scans, then close the session, the worker processes and the threat lists they use.
+        """
+        tasks = [*self.workers, *([self.sync_task] if self.sync_task else [])]
+        for i in tasks:
+            i.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.batcher.close()
+        await asyncio.to_thread(self.pool.shutdown, cancel_futures=True)
+        if self.threat_lists:
+            self.threat_lists.close()
+        await self.session.close()
+
+    def drop(self) -> None:
+        for i in self.workers:
+            i.cancel()
+        if self.sync_task:
+            self.sync_task.cancel()
+        super().drop()
+
+    async def sync_threat_lists(self) -> None:
+        """
+        Keep the local threat lists up to date, as often as the API allows.
+        """
+        while True:
+            try:
+                wait = await self.threat_lists.update()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                self.logger.warning(f"Threat list update failed: {e!r}")
+                wait = 60
+            await asyncio.sleep(wait)
+
+    async def _handle_tokens(self, event: interactions.events.MessageCreate, tokens: List[str]) -> bool:
         """
         Handle the tokens in a message.
 
         :param event: The event object.
         :type event: interactions.events.MessageCreate
+        :param tokens: The tokens found in the message.
+        :type tokens: List[str]
 
         :return: If the subsquent checks should be skipped.
         :rtype: bool
         """
-        tokens = Validator.find_tokens(event.message.content)
         for i in tokens:
             if await Validator.is_valid_token(i):
                 try:
@@ -70,20 +185,23 @@ class MessageSafety(BaseExtension):
                 break
         return False
 
-    async def _handle_urls(self, event: interactions.events.MessageCreate) -> bool:
+    async def lookup_urls(self, urls: List[str]) -> Set[str]:
         """
-        Handle the URLs in a message.
-        URL for testing: http://malware.testing.google.test/testing/malware/
+        Look up URLs with the Google Safe Browsing API.
+        The local threat lists are used once they are synced, otherwise the URLs are looked up directly.
 
-        :param event: The event object.
-        :type event: interactions.events.MessageCreate
+        :param urls: The canonical URLs to look up.
+        :type urls: List[str]
 
-        :return: If the subsequent checks should be skipped.
-        :rtype: bool
+        :raises aiohttp.ClientResponseError: Raised when the API responds with an error.
+
+        :return: The URLs that matched a threat.
+        :rtype: Set[str]
         """
-        urls = Validator.find_urls(event.message.content)
-        async with aiohttp.ClientSession() as s, s.post(
-            f"https://safebrowsing.googleapis.com/v4/threatMatches:find?key={decouple.config('googleapi')}",
+        if self.threat_lists and self.threat_lists.ready:
+            return await self.threat_lists.find(urls)
+        async with self.session.post(
+            f"{self.api_url}/threatMatches:find?key={decouple.config('googleapi')}",
             json={
                 "client": {"clientId": "NekoNode", "clientVersion": self.client.__version__},
                 "threatInfo": {
@@ -95,12 +213,47 @@ class MessageSafety(BaseExtension):
                     ],
                     "platformTypes": ["ANY_PLATFORM"],
                     "threatEntryTypes": ["URL"],
-                    "threatEntries": [{"url": i} for i in [*{"".join(i) for i in urls}]],
+                    "threatEntries": [{"url": i} for i in urls],
                 },
             },
+            raise_for_status=True,
         ) as r:
             resp = await r.json()
-        if "matches" in resp:
+        return {i["threat"]["url"] for i in resp.get("matches", [])}
+
+    async def _handle_urls(self, event: interactions.events.MessageCreate, urls: List[str]) -> bool:
+        """
+        Handle the URLs in a message.
+        URL for testing: http://malware.testing.google.test/testing/malware/
+
+        :param event: The event object.
+        :type event: interactions.events.MessageCreate
+        :param urls: The URLs found in the message.
+        :type urls: List[str]
+
+        :return: If the subsequent checks should be skipped.
+        :rtype: bool
+        """
+        unsafe = False
+        misses = []
+        for url in {canonicalize_url(i) for i in urls}:
+            verdict = self.verdicts.get(url)
+            if verdict is None:
+                misses.append(url)
+            unsafe = unsafe or bool(verdict)
+        if self.threat_lists and self.threat_lists.ready:
+            # URLs without a matching hash prefix are safe, there is nothing to ask the API
+            misses = [i for i in misses if self.threat_lists.candidates(i)]
+        if misses:
+            try:
+                matches = await self.batcher.lookup(misses)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.logger.warning(f"Safe Browsing lookup failed: {e!r}")
+                return False
+            for url in misses:
+                self.verdicts.put(url, url in matches)
+            unsafe = unsafe or bool(matches)
+        if unsafe:
             embed = Embed("檢測到可能有害的連結了！\n資料僅供參考，未必完全準確，請自行注意連結是否安全喔～")
             embed.set_footer(text="Google Safe Browsing API")
             with contextlib.suppress(interactions.errors.HTTPException):
@@ -117,17 +270,129 @@ class MessageSafety(BaseExtension):
         """
         if event.message.author.bot or event.message.author.system:
             return
-        if not event.message.guild or not event.message.content:
+        if not event.message.guild:
+            return
+
+        findings = Validator.scan(event.message.content) if event.message.content else []
+        if not findings and not any(self.is_text_attachment(i) for i in event.message.attachments):
+            return
+
+        if self.overflow == "block":
+            await self.queue.put(event.message.guild.id, (event, findings))
+        elif not self.queue.put_nowait(event.message.guild.id, (event, findings)):
+            if self.overflow == "degrade":
+                # tokens are checked locally and are the bigger risk, URL lookups are what gets dropped
+                await self.scan(event, [i for i in findings if i.kind == "token"], with_attachments=False)
+            else:
+                self.logger.debug(f"Safety queue is full, dropped the scan of message {event.message.id}.")
+
+    async def scan_worker(self) -> None:
+        """
+        Run the queued scans one after another.
+        """
+        while True:
+            event, findings = await self.queue.get()
+            try:
+                await self.scan(event, findings)
+            except Exception as e:  # pylint: disable=broad-except
+                self.logger.error(f"Failed to scan message {event.message.id}: {e!r}")
+
+    async def scan(
+        self, event: interactions.events.MessageCreate, findings: List[Finding], with_attachments: bool = True
+    ) -> None:
+        """
+        Handle the findings of a message according to the safety settings of its guild.
+
+        :param event: The event object.
+        :type event: interactions.events.MessageCreate
+        :param findings: The URLs and tokens found in the message.
+        :type findings: List[Finding]
+        :param with_attachments: Whether to also search the text attachments of the message for tokens.
+        :type with_attachments: bool
+        """
+        tokens = [i.value for i in findings if i.kind == "token"]
+        urls = [i.value for i in findings if i.kind == "url"]
+        attachments = [i for i in event.message.attachments if self.is_text_attachment(i)] if with_attachments else []
+        if not tokens and not urls and not attachments:
             return
 
         checks = await self.database.get_guild_safety_settings(event.message.guild.id)
 
-        if checks.dtoken and await self._handle_tokens(event):
+        if checks.dtoken:
+            for attachment in attachments:
+                try:
+                    tokens.extend(await self.find_attachment_tokens(attachment))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    self.logger.warning(f"Failed to scan attachment {attachment.filename}: {e!r}")
+
+        if checks.dtoken and tokens and await self._handle_tokens(event, tokens):
             return
 
-        if checks.url and await self._handle_urls(event):
+        if checks.url and urls and await self._handle_urls(event, urls):
             return
 
+    def is_text_attachment(self, attachment: interactions.Attachment) -> bool:
+        """
+        Check if an attachment is a text file that should be searched for tokens.
+
+        :param attachment: The attachment.
+        :type attachment: interactions.Attachment
+
+        :return: If the attachment should be searched.
+        :rtype: bool
+        """
+        if attachment.size > self.attachment_max_size:
+            return False
+        return attachment.filename.lower().endswith(self.text_attachments) or (
+            attachment.content_type or ""
+        ).startswith("text/plain")
+
+    async def find_attachment_tokens(self, attachment: interactions.Attachment) -> Set[str]:
+        """
+        Find the tokens in a text attachment.
+        The attachment is streamed and searched in blocks, so at most one block is held in memory at a time.
+        The blocks of large attachments are larger and searched in a worker process.
+
+        :param attachment: The attachment.
+        :type attachment: interactions.Attachment
+
+        :raises aiohttp.ClientError: Raised when the attachment could not be downloaded.
+
+        :return: The found tokens.
+        :rtype: Set[str]
+        """
+        offload = attachment.size > self.process_threshold
+        block_size = self.process_block_size if offload else self.attachment_chunk_size
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        tokens, tail, read, block, size = set(), "", 0, [], 0
+        async with self.session.get(
+            attachment.url, raise_for_status=True, timeout=aiohttp.ClientTimeout(total=None, sock_read=10)
+        ) as r:
+            async for chunk in r.content.iter_chunked(self.attachment_chunk_size):
+                read += len(chunk)
+                if read > self.attachment_max_size:
+                    break
+                block.append(decoder.decode(chunk))
+                size += len(chunk)
+                if size < block_size:
+                    continue
+                # the tail of a block is carried over, so tokens split between two blocks are still found
+                head, tail = Validator.split_token_tail(tail + "".join(block))
+                block, size = [], 0
+                tokens.update(await self._find_tokens(head, offload))
+        block.append(decoder.decode(b"", final=True))
+        tokens.update(await self._find_tokens(tail + "".join(block), offload))
+        return tokens
+
+    async def _find_tokens(self, text: str, offload: bool) -> List[str]:
+        """
+        Find the tokens in a block of an attachment, in a worker process if it should be offloaded.
+        This is an internal method and should not be called directly.
+        """
+        if not offload:
+            return Validator.find_tokens(text)
+        return await asyncio.get_running_loop().run_in_executor(self.pool, Validator.find_tokens, text)
+
     @interactions.component_callback("safety_settings:message_select")
     async def safety_settings_select(self, ctx: interactions.ComponentContext):
         """
@@ -15,11 +15,12 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import asyncio
 import copy
 import glob
 import logging
 import os
-from typing import Union
+from typing import Set, Union
 
 import interactions
 import psutil
@@ -27,11 +28,14 @@ from interactions.ext import prefixed_commands
 from scyllapy.exceptions import ScyllaPyDBError
 
 from src.core import (
+    BulkOperations,
     Config,
     DatabaseClient,
     InterceptHandler,
     Logger,
     ModifiedHTTPClient,
+    RequestScheduler,
+    RetryPolicy,
 )
 from src.utils import Embed
 
@@ -79,6 +83,9 @@ class Client(interactions.Client):
             username=self.config["database.username"],
             password=self.config["database.password"],
             keyspace=self.config["database.keyspace"],
+            cache_size=self.config.get("database.cache.size", 4096),
+            cache_ttl=self.config.get("database.cache.ttl", 300),
+            profiles=self.config.get("database.profiles"),
         )
 
         # initialize the client
@@ -94,6 +101,21 @@ class Client(interactions.Client):
         self.http: ModifiedHTTPClient = ModifiedHTTPClient(
             logger=self.logger, show_ratelimit_tracebacks=self.http.show_ratelimit_traceback, proxy=self.http.proxy
         )
+        self.http.retry = RetryPolicy(
+            max_attempts=self.config.get("http.retry.max_attempts", 3),
+            base_delay=self.config.get("http.retry.base_delay", 1),
+            max_delay=self.config.get("http.retry.max_delay", 30),
+            max_elapsed=self.config.get("http.retry.max_elapsed", 60),
+        )
+        self.http.scheduler = RequestScheduler(
+            self.http,
+            user_reserve=self.config.get("http.scheduler.user_reserve", 5),
+            background_reserve=self.config.get("http.scheduler.background_reserve", 15),
+            max_wait=self.config.get("http.scheduler.max_wait", 10),
+        )
+        self.bulk = BulkOperations(self.http, self.config.get("bulk.concurrency", 5))
+        # the closing of the unloaded extensions, awaited before the database is closed
+        self.closing: Set[asyncio.Task] = set()
 
         # load extensions
         for i in glob.glob("src/exts/**/*.py", recursive=True):
@@ -108,11 +130,13 @@ class Client(interactions.Client):
         """
         self.dev_user = await self.fetch_user(self.config["bot.developers"][0])
         try:
-            await self.database.initialize()
+            migrations = await self.database.initialize()
         except ScyllaPyDBError:
             self.logger.critical_exc("Failed to initialize the database.")
             return await self.stop()
         else:
+            for i in migrations:
+                self.logger.info(f"Applied database migration {i.feature} v{i.version}: {i.description}")
             self.logger.info("Database connection established.")
         self.logger.info(
             "\n-------------------------"
@@ -166,8 +190,13 @@ class Client(interactions.Client):
     async def stop(self) -> None:
         """
         Stops the bot and closes the database connection gracefully.
+        The extensions are closed first, so they can still save their state.
         """
         self.logger.info("Shutting down...")
+        closing = [i.close() for i in self.ext.values() if isinstance(i, BaseExtension)]
+        for result in await asyncio.gather(*closing, *self.closing, return_exceptions=True):
+            if isinstance(result, Exception):
+                self.logger.error(f"Failed to close an extension: {result!r}")
         await self.database.close()
         await super().stop()
 
@@ -250,7 +279,16 @@ class BaseExtension(interactions.Extension):
         self.client = client
         self.logger.info(f"Loaded extension {self.__class__.__name__}.")
 
+    async def close(self) -> None:
+        """
+        Finish the work of the extension, e.g. save its in-memory state.
+        This is called when the extension is unloaded and when the bot stops, so it must be safe to call twice.
+        """
+
     def drop(self) -> None:
+        task = asyncio.create_task(self.close())
+        self.client.closing.add(task)
+        task.add_done_callback(self.client.closing.discard)
         self.logger.info(f"Unloaded extension {self.__class__.__name__}.")
         return super().drop()
 
@@ -25,6 +25,7 @@ from .const import (
 from .discord import snowflake_time
 from .embed import Embed
 from .errors import BotException, Ratelimited
+from .fairqueue import FairQueue
 from .panels import (
     CountingSettings,
     DvcPanel,
@@ -38,7 +39,14 @@ from .panels import (
     PersonalSettings,
     Settings,
 )
-from .validator import Validator
+from .safebrowsing import (
+    LookupBatcher,
+    ThreatListDatabase,
+    VerdictCache,
+    canonicalize_url,
+)
+from .scheduler import DeadlineScheduler
+from .validator import Finding, Validator
 
 __all__ = (
     "Embed",
@@ -62,4 +70,11 @@ __all__ = (
     "DvcPanel",
     "CountingSettings",
     "Validator",
+    "FairQueue",
+    "DeadlineScheduler",
+    "Finding",
+    "LookupBatcher",
+    "ThreatListDatabase",
+    "VerdictCache",
+    "canonicalize_url",
 )
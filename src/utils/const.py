@@ -27,6 +27,8 @@ __all__ = (
     "DISCORD_EPOCH",
     "URL_REGEX",
     "TOKEN_REGEX",
+    "TOKEN_HINT_REGEX",
+    "SCAN_REGEX",
 )
 
 REPLY_EMOJI = interactions.PartialEmoji.from_str("<:reply:1252488534619852821>")
@@ -39,6 +41,16 @@ SWITCH_OFF_EMOJI = interactions.PartialEmoji.from_str("<:off:1252837290146005094
 
 DISCORD_EPOCH = 1420070400000
 
-URL_REGEX = re.compile(r"(http|https)(:\/\/)([\w_-]+(?:(?:\.[\w_-]+)+))([\w.,@?^=%&:\/~+#-]*[\w@?^=%&\/~+#-])")
+URL_REGEX = re.compile(r"(https?)(:\/\/)([\w_-]+(?:(?:\.[\w_-]+)+))([\w.,@?^=%&:\/~+#-]*[\w@?^=%&\/~+#-])")
 
 TOKEN_REGEX = re.compile(r"[\w-]{23,28}\.[\w-]{6,7}\.[\w-]{27,}")
+
+# the middle part of a token, which is much cheaper to search for than a whole token
+TOKEN_HINT_REGEX = re.compile(r"\.[\w-]{6,7}\.")
+
+# URL_REGEX and TOKEN_REGEX combined, so a message can be scanned for both in a single pass,
+# the tail of a token stops before a URL glued to it, otherwise the token would hide the URL
+SCAN_REGEX = re.compile(
+    r"(?P<url>https?:\/\/[\w_-]+(?:(?:\.[\w_-]+)+)[\w.,@?^=%&:\/~+#-]*[\w@?^=%&\/~+#-])"
+    r"|(?P<token>[\w-]{23,28}\.[\w-]{6,7}\.(?:[^\Wh]|-|h(?!ttps?:\/\/)){27,})"
+)
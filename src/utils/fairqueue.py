@@ -0,0 +1,145 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Generic, Hashable, Tuple, TypeVar
+
+__all__ = ("FairQueue",)
+
+T = TypeVar("T")
+
+
+class FairQueue(Generic[T]):
+    """
+    A bounded queue that hands out items of different keys in turns.
+    A key flooding the queue only delays its own items, the items of other keys keep being served.
+    """
+
+    def __init__(self, maxsize: int = 1000) -> None:
+        """
+        Initialize the queue.
+
+        :param maxsize: The maximum number of queued items.
+        :type maxsize: int
+        """
+        self.maxsize = maxsize
+        self._queues: Dict[Hashable, Deque[Tuple[float, T]]] = {}
+        self._turns: Deque[Hashable] = deque()
+        self._size = 0
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self.enqueued = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def full(self) -> bool:
+        """
+        Whether the queue is full.
+        """
+        return self._size >= self.maxsize
+
+    def _append(self, key: Hashable, item: T) -> None:
+        if key not in self._queues:
+            self._queues[key] = deque()
+            self._turns.append(key)
+        self._queues[key].append((time.monotonic(), item))
+        self._size += 1
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self._size)
+        self._not_empty.set()
+
+    def put_nowait(self, key: Hashable, item: T) -> bool:
+        """
+        Put an item into the queue if there is space.
+
+        :param key: The key the item belongs to, e.g. a guild ID.
+        :type key: Hashable
+        :param item: The item.
+        :type item: T
+
+        :return: Whether the item was queued.
+        :rtype: bool
+        """
+        if self.full():
+            self.rejected += 1
+            return False
+        self._append(key, item)
+        return True
+
+    async def put(self, key: Hashable, item: T) -> None:
+        """
+        Put an item into the queue, waiting for space if it is full.
+
+        :param key: The key the item belongs to, e.g. a guild ID.
+        :type key: Hashable
+        :param item: The item.
+        :type item: T
+        """
+        while self.full():
+            self._not_full.clear()
+            await self._not_full.wait()
+        self._append(key, item)
+
+    async def get(self) -> T:
+        """
+        Get the next item, taking turns between the keys.
+
+        :return: The item.
+        :rtype: T
+        """
+        while not self._size:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        key = self._turns.popleft()
+        queue = self._queues[key]
+        enqueued_at, item = queue.popleft()
+        if queue:
+            self._turns.append(key)
+        else:
+            del self._queues[key]
+        self._size -= 1
+        self._not_full.set()
+        wait = time.monotonic() - enqueued_at
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        return item
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the counters of the queue.
+
+        :return: The current and maximum depth, the queued and rejected items, and the average and maximum wait time.
+        :rtype: Dict[str, Any]
+        """
+        served = self.enqueued - self._size
+        return {
+            "depth": self._size,
+            "max_depth": self.max_depth,
+            "keys": len(self._queues),
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "average_wait": self.total_wait / served if served else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+    def __len__(self) -> int:
+        return self._size
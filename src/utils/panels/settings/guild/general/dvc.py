@@ -56,6 +56,8 @@ class DvcSettings:
             name="名稱格式",
             value=f"`{dvc.name}`" if dvc.name else "未設置",
         )
+        if job := ctx.client.bulk.get(("dvc", ctx.guild.id)):
+            embed.add_field(name="頻道刪除進度", value=f"{job.deleted + job.failed}/{job.total}")
         return embed
 
     @staticmethod
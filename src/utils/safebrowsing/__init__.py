@@ -0,0 +1,34 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from .batcher import LookupBatcher
+from .cache import VerdictCache
+from .canonical import canonicalize_url, normalize_ip
+from .database import THREAT_LISTS, PrefixSet, ThreatListDatabase
+from .hashing import url_expressions, url_hashes
+
+__all__ = (
+    "LookupBatcher",
+    "VerdictCache",
+    "canonicalize_url",
+    "normalize_ip",
+    "THREAT_LISTS",
+    "PrefixSet",
+    "ThreatListDatabase",
+    "url_expressions",
+    "url_hashes",
+)
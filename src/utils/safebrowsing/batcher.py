@@ -0,0 +1,129 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+__all__ = ("LookupBatcher",)
+
+
+class LookupBatcher:
+    """
+    Collects the URLs of many concurrent lookups over a short window and looks them up together.
+    Each caller only receives the matches of its own URLs.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[List[str]], Awaitable[Set[str]]],
+        window: float = 0.05,
+        max_size: int = 500,
+    ) -> None:
+        """
+        Initialize the batcher.
+
+        :param fetch: The function looking up a batch of URLs and returning the ones that matched.
+        :type fetch: Callable[[List[str]], Awaitable[Set[str]]]
+        :param window: The maximum time in seconds a URL waits for its batch to fill up.
+        :type window: float
+        :param max_size: The maximum number of URLs in a batch, a full batch is sent immediately.
+        :type max_size: int
+        """
+        self.fetch = fetch
+        self.window = window
+        self.max_size = max_size
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.urls = 0
+
+    async def lookup(self, urls: Iterable[str]) -> Set[str]:
+        """
+        Look up URLs as part of the next batch.
+
+        :param urls: The URLs to look up.
+        :type urls: Iterable[str]
+
+        :return: The URLs that matched.
+        :rtype: Set[str]
+        """
+        loop = asyncio.get_running_loop()
+        futures = {}
+        for url in urls:
+            if (future := self._pending.get(url)) is None:
+                future = self._pending[url] = loop.create_future()
+            futures[url] = future
+        if len(self._pending) >= self.max_size:
+            self.flush()
+        elif self._pending and self._timer is None:
+            self._timer = loop.call_later(self.window, self.flush)
+        # the futures are shared with other callers, cancelling this lookup must not cancel theirs
+        results = await asyncio.gather(*map(asyncio.shield, futures.values()))
+        return {url for url, matched in zip(futures, results) if matched}
+
+    def flush(self) -> None:
+        """
+        Send the pending URLs now.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = list(self._pending.items()), {}
+        for i in range(0, len(pending), self.max_size):
+            task = asyncio.create_task(self._send(dict(pending[i : i + self.max_size])))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def close(self) -> None:
+        """
+        Send the pending URLs and wait for the batches in flight.
+        """
+        self.flush()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _send(self, batch: Dict[str, asyncio.Future]) -> None:
+        """
+        Send a batch and resolve the futures of its URLs.
+        This is an internal method and should not be called directly.
+        """
+        self.batches += 1
+        self.urls += len(batch)
+        try:
+            matches = await self.fetch(list(batch))
+        except Exception as e:  # pylint: disable=broad-except
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for url, future in batch.items():
+            if not future.done():
+                future.set_result(url in matches)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """
+        Get the counters of the batcher.
+
+        :return: The sent batches and URLs, and the average number of URLs per batch.
+        :rtype: Dict[str, float]
+        """
+        return {
+            "batches": self.batches,
+            "urls": self.urls,
+            "average_size": self.urls / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,79 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from typing import Any, Dict, Optional
+
+from src.core.database.cache import TTLCache
+
+__all__ = ("VerdictCache",)
+
+
+class VerdictCache:
+    """
+    A bounded cache of Safe Browsing verdicts keyed on canonical URLs.
+    Safe and unsafe verdicts expire after separate times.
+    """
+
+    def __init__(self, maxsize: int = 10000, safe_ttl: float = 1800, unsafe_ttl: float = 3600) -> None:
+        """
+        Initialize the cache.
+
+        :param maxsize: The maximum number of cached verdicts.
+        :type maxsize: int
+        :param safe_ttl: The time in seconds before a safe verdict expires.
+        :type safe_ttl: float
+        :param unsafe_ttl: The time in seconds before an unsafe verdict expires.
+        :type unsafe_ttl: float
+        """
+        self.safe_ttl = safe_ttl
+        self.unsafe_ttl = unsafe_ttl
+        self._cache: TTLCache[bool] = TTLCache(maxsize, safe_ttl)
+
+    def get(self, url: str) -> Optional[bool]:
+        """
+        Get the verdict of a URL.
+
+        :param url: The canonical URL.
+        :type url: str
+
+        :return: Whether the URL is unsafe, or None if there is no cached verdict.
+        :rtype: Optional[bool]
+        """
+        return self._cache.get(url)
+
+    def put(self, url: str, unsafe: bool) -> None:
+        """
+        Cache the verdict of a URL.
+
+        :param url: The canonical URL.
+        :type url: str
+        :param unsafe: Whether the URL is unsafe.
+        :type unsafe: bool
+        """
+        self._cache.put(url, unsafe, self.unsafe_ttl if unsafe else self.safe_ttl)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the counters of the cache.
+
+        :return: The size, hits, misses, evictions and hit rate of the cache.
+        :rtype: Dict[str, Any]
+        """
+        stats = self._cache.stats
+        total = stats["hits"] + stats["misses"]
+        return {**stats, "hit_rate": stats["hits"] / total if total else 0.0}
@@ -0,0 +1,139 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+import socket
+import struct
+from typing import Optional
+from urllib.parse import unquote_to_bytes
+
+__all__ = ("canonicalize_url", "normalize_ip")
+
+_URL_REGEX = re.compile(r"^(?:([a-zA-Z][a-zA-Z0-9+.-]*):)?(?://([^/?]*))?([^?]*)(?:\?(.*))?$", re.S)
+
+
+def _unescape(value: str) -> str:
+    """
+    Repeatedly percent-unescape a string until it contains no more escapes.
+    The result holds one character per byte, so non-ASCII characters are escaped as their UTF-8 bytes later.
+    """
+    data = value.encode("utf-8")
+    while True:
+        unescaped = unquote_to_bytes(data)
+        if unescaped == data:
+            return data.decode("latin-1")
+        data = unescaped
+
+
+def _escape(value: str) -> str:
+    """
+    Percent-escape the characters <= ASCII 32, >= 127, "#" and "%".
+    """
+    return "".join(f"%{ord(i):02X}" if ord(i) <= 32 or ord(i) >= 127 or i in "#%" else i for i in value)
+
+
+def normalize_ip(host: str) -> Optional[str]:
+    """
+    Normalize a host to four dotted decimal components if it is an IPv4 address in any notation.
+
+    :param host: The host.
+    :type host: str
+
+    :return: The normalized address, or None if the host is not an IPv4 address.
+    :rtype: Optional[str]
+    """
+    try:
+        return socket.inet_ntoa(struct.pack("!I", _parse_ip(host)))
+    except (ValueError, struct.error):
+        return None
+
+
+def _parse_ip(host: str) -> int:
+    """
+    Parse an IPv4 address which may be written with octal, hex or fewer than four components.
+
+    :raises ValueError: Raised when the host is not an IPv4 address.
+    """
+    parts = host.split(".")
+    if not 1 <= len(parts) <= 4:
+        raise ValueError(host)
+    values = []
+    for part in parts:
+        if part.lower().startswith("0x"):
+            values.append(int(part[2:] or "0", 16))
+        elif len(part) > 1 and part.startswith("0"):
+            values.append(int(part, 8))
+        else:
+            values.append(int(part, 10))
+    # the last component fills all remaining bytes, e.g. 1.2.3 is 1.2.0.3
+    address = 0
+    for value in values[:-1]:
+        if value > 255:
+            raise ValueError(host)
+        address = address << 8 | value
+    remaining = 4 - len(values) + 1
+    if values[-1] >= 1 << (8 * remaining):
+        raise ValueError(host)
+    return address << (8 * remaining) | values[-1]
+
+
+def _canonicalize_path(path: str) -> str:
+    """
+    Resolve "/./" and "/../" and collapse consecutive slashes in a path.
+    """
+    segments = []
+    for segment in path.split("/")[1:]:
+        if segment == "..":
+            if segments:
+                segments.pop()
+        elif segment not in (".", ""):
+            segments.append(segment)
+    # keep the trailing slash, including the one implied by a trailing "." or ".."
+    trailing = path.endswith(("/", "/.", "/..")) and bool(segments)
+    return "/" + "/".join(segments) + ("/" if trailing else "")
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Canonicalize a URL following the Google Safe Browsing v4 URL canonicalization rules.
+    https://developers.google.com/safe-browsing/v4/urls-hashing#canonicalization
+
+    :param url: The URL to canonicalize.
+    :type url: str
+
+    :return: The canonical URL.
+    :rtype: str
+    """
+    url = re.sub(r"[\t\r\n]", "", url.strip()).split("#", 1)[0]
+    url = _unescape(url)
+    if "://" not in url:
+        url = f"http://{url}"
+
+    scheme, authority, path, query = _URL_REGEX.match(url).groups()
+    scheme = (scheme or "http").lower()
+
+    host = authority or ""
+    host = host.rsplit("@", 1)[-1].split(":", 1)[0]
+    # only lowercase ASCII letters, the other characters are raw bytes at this point
+    host = re.sub(r"\.{2,}", ".", host.strip(".")).encode("latin-1").lower().decode("latin-1")
+    host = normalize_ip(host) or host
+
+    path = _canonicalize_path(path or "/")
+    canonical = f"{scheme}://{_escape(host)}{_escape(path)}"
+    if query is not None:
+        canonical += f"?{_escape(query)}"
+    return canonical
@@ -0,0 +1,380 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import mmap
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import aiohttp
+
+from src.core.database.cache import TTLCache
+
+from .hashing import url_hashes
+
+__all__ = ("API_URL", "THREAT_LISTS", "PrefixSet", "ThreatListDatabase")
+
+API_URL = "https://safebrowsing.googleapis.com/v4"
+
+THREAT_LISTS: Tuple[Tuple[str, str, str], ...] = tuple(
+    (i, "ANY_PLATFORM", "URL")
+    for i in ("MALWARE", "SOCIAL_ENGINEERING", "UNWANTED_SOFTWARE", "POTENTIALLY_HARMFUL_APPLICATION")
+)
+
+
+def _duration(value: Optional[str], default: float = 0) -> float:
+    """
+    Parse a protobuf duration such as "300.5s".
+    """
+    return float(value.rstrip("s")) if value else default
+
+
+class PrefixSet:
+    """
+    The hash prefixes of one threat list, stored as sorted fixed-width records in memory-mapped files.
+    Every prefix size is kept in its own file, so a lookup is a binary search over the mapped bytes.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initialize the prefix set.
+
+        :param path: The path of the files without the prefix size suffix.
+        :type path: str
+        """
+        self.path = path
+        self._maps: Dict[int, mmap.mmap] = {}
+
+    def _file(self, size: int) -> str:
+        return f"{self.path}.{size}.bin"
+
+    def load(self) -> None:
+        """
+        Map the prefix files that exist on disk.
+        """
+        self.close()
+        for size in range(4, 33):
+            if os.path.exists(self._file(size)) and os.path.getsize(self._file(size)):
+                with open(self._file(size), "rb") as f:
+                    self._maps[size] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        """
+        Unmap the prefix files.
+        """
+        for i in self._maps.values():
+            i.close()
+        self._maps.clear()
+
+    def match(self, full_hash: bytes) -> Optional[bytes]:
+        """
+        Find the prefix of a full hash.
+
+        :param full_hash: The SHA256 full hash.
+        :type full_hash: bytes
+
+        :return: The matching prefix, or None if there is none.
+        :rtype: Optional[bytes]
+        """
+        for size, data in self._maps.items():
+            prefix = full_hash[:size]
+            lo, hi = 0, len(data) // size
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if data[mid * size : (mid + 1) * size] < prefix:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo < len(data) // size and data[lo * size : (lo + 1) * size] == prefix:
+                return prefix
+        return None
+
+    def prefixes(self) -> List[bytes]:
+        """
+        Get all prefixes in lexicographic order, which is the order the removal indices refer to.
+
+        :return: The prefixes.
+        :rtype: List[bytes]
+        """
+        return sorted(data[i : i + size] for size, data in self._maps.items() for i in range(0, len(data), size))
+
+    def write(self, prefixes: Iterable[bytes]) -> None:
+        """
+        Write a new set of prefixes to temporary files next to the current ones.
+        The files replace the current ones once `swap` is called.
+
+        :param prefixes: The sorted prefixes.
+        :type prefixes: Iterable[bytes]
+        """
+        sizes: Dict[int, List[bytes]] = {size: [] for size in range(4, 33)}
+        for prefix in prefixes:
+            sizes[len(prefix)].append(prefix)
+        for size, records in sizes.items():
+            with open(f"{self._file(size)}.tmp", "wb") as f:
+                f.write(b"".join(records))
+
+    def swap(self) -> None:
+        """
+        Replace the current files with the ones written by `write` and map them.
+        """
+        self.close()
+        for size in range(4, 33):
+            if os.path.exists(f"{self._file(size)}.tmp"):
+                os.replace(f"{self._file(size)}.tmp", self._file(size))
+        self.load()
+
+    def __len__(self) -> int:
+        return sum(len(data) // size for size, data in self._maps.items())
+
+
+class ThreatListDatabase:
+    """
+    A local copy of the Safe Browsing v4 threat lists, kept up to date with the Update API.
+    https://developers.google.com/safe-browsing/v4/update-api
+
+    URLs are hashed and checked against the local hash prefixes first.
+    Only URLs with a matching prefix need a `fullHashes:find` request to get a verdict.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        session: aiohttp.ClientSession,
+        key: str,
+        client_version: str,
+        api_url: str = API_URL,
+        threat_lists: Tuple[Tuple[str, str, str], ...] = THREAT_LISTS,
+    ) -> None:
+        """
+        Initialize the database.
+
+        :param path: The directory to store the threat lists in.
+        :type path: str
+        :param session: The session to send the requests with.
+        :type session: aiohttp.ClientSession
+        :param key: The Google API key.
+        :type key: str
+        :param client_version: The client version reported to the API.
+        :type client_version: str
+        :param api_url: The base URL of the API, which can point to a local server for testing.
+        :type api_url: str
+        :param threat_lists: The threat type, platform type and threat entry type of the lists to keep.
+        :type threat_lists: Tuple[Tuple[str, str, str], ...]
+        """
+        self.path = path
+        self.session = session
+        self.key = key
+        self.client_version = client_version
+        self.api_url = api_url.rstrip("/")
+        self.threat_lists = threat_lists
+        self.sets = {i: PrefixSet(os.path.join(path, "_".join(i))) for i in threat_lists}
+        self.states: Dict[Tuple[str, str, str], str] = {}
+        # full hashes returned for a prefix, an empty set caches a negative answer
+        self.full_hashes: TTLCache[frozenset] = TTLCache(10000, 300)
+        # the prefix matches of recently checked URLs, a URL is checked before and again during its lookup
+        self.matches: TTLCache[Dict[bytes, bytes]] = TTLCache(4096, 60)
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether every threat list has been synced at least once.
+        """
+        return all(i in self.states for i in self.threat_lists)
+
+    def load(self) -> None:
+        """
+        Load the threat lists that were synced before.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            with open(os.path.join(self.path, "state.json"), encoding="utf-8") as f:
+                states = json.load(f)
+        except (OSError, ValueError):
+            states = {}
+        for threat_list, prefix_set in self.sets.items():
+            prefix_set.load()
+            if "_".join(threat_list) in states:
+                self.states[threat_list] = states["_".join(threat_list)]
+
+    def close(self) -> None:
+        """
+        Unmap the threat lists.
+        """
+        for i in self.sets.values():
+            i.close()
+
+    def _save_states(self) -> None:
+        with open(os.path.join(self.path, "state.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump({"_".join(k): v for k, v in self.states.items()}, f)
+        os.replace(os.path.join(self.path, "state.json.tmp"), os.path.join(self.path, "state.json"))
+
+    async def _post(self, method: str, payload: dict) -> dict:
+        async with self.session.post(
+            f"{self.api_url}/{method}?key={self.key}",
+            json={"client": {"clientId": "NekoNode", "clientVersion": self.client_version}, **payload},
+            raise_for_status=True,
+        ) as r:
+            return await r.json()
+
+    async def update(self) -> float:
+        """
+        Fetch and apply the updates of the threat lists.
+
+        :raises aiohttp.ClientError: Raised when the API responds with an error.
+        :raises ValueError: Raised when an updated list does not match its checksum, it is fully synced next time.
+
+        :return: The time in seconds to wait before the next update.
+        :rtype: float
+        """
+        resp = await self._post(
+            "threatListUpdates:fetch",
+            {
+                "listUpdateRequests": [
+                    {
+                        "threatType": threat_type,
+                        "platformType": platform_type,
+                        "threatEntryType": entry_type,
+                        "state": self.states.get((threat_type, platform_type, entry_type), ""),
+                        # rice-encoded updates are smaller, but raw updates need no decoder
+                        "constraints": {"supportedCompressions": ["RAW"]},
+                    }
+                    for threat_type, platform_type, entry_type in self.threat_lists
+                ]
+            },
+        )
+        try:
+            for update in resp.get("listUpdateResponses", []):
+                threat_list = (update["threatType"], update["platformType"], update["threatEntryType"])
+                if threat_list not in self.sets:
+                    continue
+                # rebuilding a large list takes a while, so keep it away from the event loop
+                await asyncio.to_thread(self._apply, threat_list, update)
+                self.sets[threat_list].swap()
+                self.states[threat_list] = update["newClientState"]
+        finally:
+            self.matches.clear()
+            self._save_states()
+        return _duration(resp.get("minimumWaitDuration"), 1800)
+
+    def _apply(self, threat_list: Tuple[str, str, str], update: dict) -> None:
+        """
+        Apply an update to a copy of a threat list and verify its checksum.
+        This is an internal method and should not be called directly.
+        """
+        prefixes = [] if update.get("responseType") == "FULL_UPDATE" else self.sets[threat_list].prefixes()
+        removed = {i for removal in update.get("removals", []) for i in removal["rawIndices"]["indices"]}
+        if removed:
+            prefixes = [prefix for i, prefix in enumerate(prefixes) if i not in removed]
+        for addition in update.get("additions", []):
+            size = addition["rawHashes"]["prefixSize"]
+            data = base64.b64decode(addition["rawHashes"]["rawHashes"])
+            prefixes.extend(data[i : i + size] for i in range(0, len(data), size))
+        prefixes.sort()
+        checksum = update.get("checksum", {}).get("sha256")
+        if checksum and hashlib.sha256(b"".join(prefixes)).digest() != base64.b64decode(checksum):
+            self.states.pop(threat_list, None)
+            raise ValueError(f"Checksum mismatch for threat list {'_'.join(threat_list)}.")
+        self.sets[threat_list].write(prefixes)
+
+    def candidates(self, url: str) -> Dict[bytes, bytes]:
+        """
+        Check a URL against the local hash prefixes.
+
+        :param url: The canonical URL.
+        :type url: str
+
+        :return: The full hashes of the URL that have a matching prefix, mapped to that prefix.
+        :rtype: Dict[bytes, bytes]
+        """
+        if (matches := self.matches.get(url)) is not None:
+            return matches
+        matches = {}
+        for full_hash in url_hashes(url):
+            for prefix_set in self.sets.values():
+                if prefix := prefix_set.match(full_hash):
+                    matches[full_hash] = prefix
+                    break
+        self.matches.put(url, matches)
+        return matches
+
+    async def find(self, urls: List[str]) -> Set[str]:
+        """
+        Look up URLs, only prefixes that match locally and are not cached are sent to the API.
+
+        :param urls: The canonical URLs to look up.
+        :type urls: List[str]
+
+        :raises aiohttp.ClientError: Raised when the API responds with an error.
+
+        :return: The URLs that matched a threat.
+        :rtype: Set[str]
+        """
+        candidates = {url: matches for url in urls if (matches := self.candidates(url))}
+        known: Dict[bytes, frozenset] = {}
+        unknown: Set[bytes] = set()
+        for prefix in {i for matches in candidates.values() for i in matches.values()}:
+            if (full_hashes := self.full_hashes.get(prefix)) is None:
+                unknown.add(prefix)
+            else:
+                known[prefix] = full_hashes
+        if unknown:
+            known.update(await self.find_full_hashes(unknown))
+        return {
+            url
+            for url, matches in candidates.items()
+            if any(full_hash in known.get(prefix, ()) for full_hash, prefix in matches.items())
+        }
+
+    async def find_full_hashes(self, prefixes: Set[bytes]) -> Dict[bytes, frozenset]:
+        """
+        Get the full hashes of hash prefixes from the API and cache them for as long as the API allows.
+
+        :param prefixes: The hash prefixes.
+        :type prefixes: Set[bytes]
+
+        :raises aiohttp.ClientError: Raised when the API responds with an error.
+
+        :return: The full hashes mapped by their prefixes.
+        :rtype: Dict[bytes, frozenset]
+        """
+        resp = await self._post(
+            "fullHashes:find",
+            {
+                "clientStates": [self.states[i] for i in self.threat_lists if i in self.states],
+                "threatInfo": {
+                    "threatTypes": sorted({i[0] for i in self.threat_lists}),
+                    "platformTypes": sorted({i[1] for i in self.threat_lists}),
+                    "threatEntryTypes": sorted({i[2] for i in self.threat_lists}),
+                    "threatEntries": [{"hash": base64.b64encode(i).decode()} for i in prefixes],
+                },
+            },
+        )
+        found: Dict[bytes, Set[bytes]] = {i: set() for i in prefixes}
+        ttl: Dict[bytes, float] = {}
+        for match in resp.get("matches", []):
+            full_hash = base64.b64decode(match["threat"]["hash"])
+            for prefix in prefixes:
+                if full_hash.startswith(prefix):
+                    found[prefix].add(full_hash)
+                    ttl[prefix] = min(ttl.get(prefix, float("inf")), _duration(match.get("cacheDuration"), 300))
+        negative_ttl = _duration(resp.get("negativeCacheDuration"), 300)
+        for prefix, full_hashes in found.items():
+            self.full_hashes.put(prefix, frozenset(full_hashes), ttl.get(prefix, negative_ttl))
+        return {k: frozenset(v) for k, v in found.items()}
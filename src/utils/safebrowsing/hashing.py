@@ -0,0 +1,72 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+from typing import Dict, List
+
+from .canonical import normalize_ip
+
+__all__ = ("url_expressions", "url_hashes")
+
+
+def _host_suffixes(host: str) -> List[str]:
+    """
+    Get the host suffixes to check, the exact host and up to 4 suffixes built from the last 5 components.
+    """
+    if normalize_ip(host) == host:
+        return [host]
+    parts = host.split(".")
+    return [host] + [".".join(parts[i:]) for i in range(max(len(parts) - 5, 1), len(parts) - 1)]
+
+
+def _path_prefixes(path: str) -> List[str]:
+    """
+    Get the path prefixes to check, the exact path with and without the query and up to 4 directory prefixes.
+    """
+    path_only, _, _ = path.partition("?")
+    prefixes = [path, path_only]
+    directories = path_only.split("/")[1:-1]
+    prefixes += ["/" + "".join(f"{i}/" for i in directories[:n]) for n in range(min(len(directories), 3) + 1)]
+    return list(dict.fromkeys(prefixes))
+
+
+def url_expressions(url: str) -> List[str]:
+    """
+    Get the host suffix / path prefix expressions of a canonical URL.
+    https://developers.google.com/safe-browsing/v4/urls-hashing#suffixprefix-expressions
+
+    :param url: The canonical URL.
+    :type url: str
+
+    :return: The expressions, at most 30.
+    :rtype: List[str]
+    """
+    host, _, path = url.split("://", 1)[-1].partition("/")
+    return [f"{h}{p}" for h in _host_suffixes(host) for p in _path_prefixes(f"/{path}")]
+
+
+def url_hashes(url: str) -> Dict[bytes, str]:
+    """
+    Get the SHA256 full hashes of the expressions of a canonical URL.
+
+    :param url: The canonical URL.
+    :type url: str
+
+    :return: The expressions mapped by their full hashes.
+    :rtype: Dict[bytes, str]
+    """
+    return {hashlib.sha256(i.encode("utf-8")).digest(): i for i in url_expressions(url)}
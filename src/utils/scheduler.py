@@ -0,0 +1,123 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+__all__ = ("DeadlineScheduler",)
+
+K = TypeVar("K", bound=Hashable)
+
+
+class DeadlineScheduler(Generic[K]):
+    """
+    Runs a callback for keys once their deadline has passed.
+    The deadlines are kept in a heap and a single task sleeps until the earliest one,
+    so thousands of pending keys cost no more than one timer.
+    """
+
+    def __init__(self, callback: Callable[[K], Awaitable[None]]) -> None:
+        """
+        Initialize the scheduler.
+
+        :param callback: The coroutine function called with every key that is due.
+        :type callback: Callable[[K], Awaitable[None]]
+        """
+        self.callback = callback
+        self._heap: List[Tuple[float, int, K]] = []
+        self._deadlines: Dict[K, Tuple[float, int]] = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+    def schedule(self, key: K, delay: float) -> None:
+        """
+        Schedule a key, replacing its previous deadline.
+
+        :param key: The key.
+        :type key: K
+        :param delay: The time in seconds until the callback is run.
+        :type delay: float
+        """
+        entry = (time.monotonic() + delay, next(self._counter))
+        self._deadlines[key] = entry
+        heapq.heappush(self._heap, (*entry, key))
+        if self._heap[0][1] == entry[1]:
+            self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def cancel(self, key: K) -> bool:
+        """
+        Cancel the deadline of a key.
+        The heap entry is left behind and skipped once it comes up.
+
+        :param key: The key.
+        :type key: K
+
+        :return: Whether the key was scheduled.
+        :rtype: bool
+        """
+        return self._deadlines.pop(key, None) is not None
+
+    def close(self) -> None:
+        """
+        Stop the scheduler and forget all deadlines.
+        """
+        if self._task:
+            self._task.cancel()
+        self._heap.clear()
+        self._deadlines.clear()
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, seq, key = heapq.heappop(self._heap)
+                if self._deadlines.get(key) != (deadline, seq):
+                    continue
+                del self._deadlines[key]
+                task = asyncio.create_task(self.callback(key))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._deadlines
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
@@ -1,10 +1,23 @@
 import binascii
+import dataclasses
 from base64 import urlsafe_b64decode
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
-from .const import TOKEN_REGEX, URL_REGEX
+from .const import SCAN_REGEX, TOKEN_HINT_REGEX, TOKEN_REGEX, URL_REGEX
 
-__all__ = ("Validator",)
+__all__ = ("Finding", "Validator")
+
+
+@dataclasses.dataclass
+class Finding:
+    """
+    Something found in a message by `Validator.scan`.
+    """
+
+    kind: str  # "url" or "token"
+    value: str
+    start: int
+    end: int
 
 
 class Validator:
@@ -38,6 +51,62 @@ class Validator:
         """
         return TOKEN_REGEX.findall(text)
 
+    @classmethod
+    def split_token_tail(cls, text: str, max_tail: int = 1024) -> Tuple[str, str]:
+        """
+        Split a chunk of a longer text before the characters that could continue in the next chunk.
+        A token cannot span the split, so the head can be searched on its own,
+        and the tail is prepended to the next chunk.
+
+        :param text: The chunk, including the tail of the previous chunk.
+        :type text: str
+        :param max_tail: The maximum length of the tail, which caps the memory used in between chunks.
+        :type max_tail: int
+
+        :return: The head to search and the tail to carry over.
+        :rtype: Tuple[str, str]
+        """
+        start = len(text)
+        while start > max(len(text) - max_tail, 0) and (text[start - 1].isalnum() or text[start - 1] in "_.-"):
+            start -= 1
+        return text[:start], text[start:]
+
+    @classmethod
+    def scan(cls, text: str) -> List[Finding]:
+        """
+        Find all URLs and tokens in a string with a single pass.
+        Cheap checks run first, so most messages are never matched against a regex at all.
+
+        :param text: The text to search.
+        :type text: str
+
+        :return: The findings in the order they appear.
+        :rtype: List[Finding]
+        """
+        has_url = "http" in text
+        # a token is at least 58 characters long and has two dots around its middle part
+        has_token = len(text) >= 58 and TOKEN_HINT_REGEX.search(text) is not None
+        if has_url and has_token:
+            regex = SCAN_REGEX
+        elif has_url:
+            regex = URL_REGEX
+        elif has_token:
+            regex = TOKEN_REGEX
+        else:
+            return []
+
+        findings = []
+        for match in regex.finditer(text):
+            kind = match.lastgroup if regex is SCAN_REGEX else "url" if has_url else "token"
+            findings.append(Finding(kind, match.group(), match.start(), match.end()))
+            # a token can also be hidden inside a URL, e.g. in its query
+            if kind == "url" and has_token:
+                findings.extend(
+                    Finding("token", i.group(), i.start(), i.end())
+                    for i in TOKEN_REGEX.finditer(text, match.start(), match.end())
+                )
+        return findings
+
     @staticmethod
     async def is_valid_token(token: str) -> bool:
         """
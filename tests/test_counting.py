@@ -0,0 +1,74 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import unittest
+
+from src.exts.guild.fun.counting import ExpressionEvaluator
+
+
+class ExpressionEvaluatorTest(unittest.IsolatedAsyncioTestCase):
+    """
+    The results and the cost limits of the counting expressions.
+    """
+
+    def setUp(self) -> None:
+        self.evaluator = ExpressionEvaluator(max_nodes=16, max_bits=64, max_exponent=16, thread_threshold=8)
+
+    async def test_arithmetic(self) -> None:
+        self.assertEqual(await self.evaluator.evaluate("1 + 2 * 3"), 7)
+        self.assertEqual(await self.evaluator.evaluate("-(7 // 2) % 5"), 2)
+        self.assertEqual(await self.evaluator.evaluate("2 ** 10"), 1024)
+        self.assertEqual(await self.evaluator.evaluate("6 ^ 3"), 5)
+        self.assertEqual(await self.evaluator.evaluate("7 / 2"), 3.5)
+
+    async def test_too_many_nodes(self) -> None:
+        with self.assertRaises(ValueError):
+            await self.evaluator.evaluate("+".join(["1"] * 9))
+
+    async def test_exponent_limit(self) -> None:
+        with self.assertRaises(ValueError):
+            await self.evaluator.evaluate("2 ** 17")
+        with self.assertRaises(ValueError):
+            await self.evaluator.evaluate("1000 ** 16")
+
+    async def test_product_and_value_limits(self) -> None:
+        with self.assertRaises(ValueError):
+            await self.evaluator.evaluate("4294967296 * 4294967296")
+        with self.assertRaises(ValueError):
+            await self.evaluator.evaluate("36893488147419103232")
+
+    async def test_unsupported_syntax(self) -> None:
+        for expr in ("abs(1)", "x + 1", "'1' * 3", "[1][0]", "1 << 2"):
+            with self.subTest(expr=expr), self.assertRaises(TypeError):
+                await self.evaluator.evaluate(expr)
+        with self.assertRaises(SyntaxError):
+            await self.evaluator.evaluate("1 +")
+
+    async def test_heavy_expression_timeout(self) -> None:
+        evaluator = ExpressionEvaluator(thread_threshold=0, timeout=0)
+        with self.assertRaises(asyncio.TimeoutError):
+            await evaluator.evaluate("2 ** 256 ** 1")
+
+    async def test_parse_is_cached(self) -> None:
+        await self.evaluator.evaluate("1 + 1")
+        await self.evaluator.evaluate("1 + 1")
+        self.assertEqual(self.evaluator.parse.cache_info().hits, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import unittest
+
+from src.core.database import DatabaseClient
+
+
+class ExecutePreparedTest(unittest.IsolatedAsyncioTestCase):
+    """
+    The single-flight sharing of prepared reads.
+    """
+
+    async def asyncSetUp(self) -> None:
+        self.client = DatabaseClient(hosts=["localhost:9042"])
+        self.client._statements = {"select": ("SELECT * FROM t WHERE id = :id;", "read")}
+        self.client._ready.set()
+        self.calls = []
+
+        async def execute(_name, params, _paged):
+            self.calls.append(params)
+            await asyncio.sleep(0.01)
+            return params
+
+        self.client._execute_prepared = execute
+
+    async def test_named_params_with_different_values(self) -> None:
+        results = await asyncio.gather(
+            self.client.execute_prepared("select", {"id": 1}),
+            self.client.execute_prepared("select", {"id": 2}),
+        )
+        self.assertEqual(results, [{"id": 1}, {"id": 2}])
+        self.assertEqual(len(self.calls), 2)
+
+    async def test_positional_params_with_different_values(self) -> None:
+        results = await asyncio.gather(
+            self.client.execute_prepared("select", (1,)),
+            self.client.execute_prepared("select", ("1",)),
+        )
+        self.assertEqual(results, [(1,), ("1",)])
+        self.assertEqual(len(self.calls), 2)
+
+    async def test_identical_reads_are_shared(self) -> None:
+        results = await asyncio.gather(
+            self.client.execute_prepared("select", {"id": 1}),
+            self.client.execute_prepared("select", {"id": 1}),
+        )
+        self.assertEqual(results, [{"id": 1}, {"id": 1}])
+        self.assertEqual(len(self.calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+from src.core.metrics import HTTPMetrics, RouteMetrics
+
+
+class ExportTest(unittest.TestCase):
+    """
+    The Prometheus text export of the HTTP metrics.
+    """
+
+    def setUp(self) -> None:
+        self.metrics = HTTPMetrics()
+        for route, status in (("GET /channels/{channel_id}", 200), ('PATCH /a"b', 429)):
+            self.metrics.routes[route] = RouteMetrics()
+            HTTPMetrics.observe(self.metrics.routes[route], status, 0.1, {})
+        self.metrics.observe_lock_wait(0.5)
+
+    def test_families_are_contiguous(self) -> None:
+        family, seen = None, set()
+        for line in self.metrics.export().splitlines():
+            if line.startswith("# TYPE "):
+                family = line.split()[2]
+                self.assertNotIn(family, seen)
+                seen.add(family)
+                continue
+            name = line.split("{")[0].split(" ")[0]
+            self.assertTrue(name.startswith(family), line)
+        self.assertEqual(
+            seen,
+            {
+                "discord_http_request_duration_seconds",
+                "discord_http_responses_total",
+                "discord_http_ratelimits_total",
+                "discord_http_errors_total",
+                "discord_http_global_lock_wait_seconds",
+            },
+        )
+
+    def test_labels_are_escaped(self) -> None:
+        self.assertIn('discord_http_errors_total{route="PATCH /a\\"b"} 0', self.metrics.export())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import unittest
+from unittest import mock
+
+from interactions.api.http.route import Route
+
+from src.core.ratelimit import RateLimitPredictor
+
+
+def headers(limit: int, remaining: int, reset_after: float, bucket: str = "abc") -> dict:
+    return {
+        "x-ratelimit-limit": str(limit),
+        "x-ratelimit-remaining": str(remaining),
+        "x-ratelimit-reset-after": str(reset_after),
+        "x-ratelimit-bucket": bucket,
+    }
+
+
+class RateLimitPredictorTest(unittest.TestCase):
+    """
+    The local model of the route buckets.
+    """
+
+    def setUp(self) -> None:
+        self.predictor = RateLimitPredictor()
+        self.route = Route("PATCH", "/channels/{channel_id}", channel_id=1)
+
+    def test_unknown_route_is_allowed(self) -> None:
+        self.assertEqual(self.predictor.acquire(self.route), 0)
+        self.assertEqual(self.predictor.predicted, 0)
+
+    def test_tokens_are_taken_locally(self) -> None:
+        with mock.patch("time.monotonic", return_value=100):
+            self.predictor.update(self.route, headers(2, 2, 5))
+            self.assertEqual(self.predictor.acquire(self.route), 0)
+            self.assertEqual(self.predictor.acquire(self.route), 0)
+            self.assertEqual(self.predictor.acquire(self.route), 5)
+        self.assertEqual(self.predictor.predicted, 1)
+
+    def test_bucket_refills_after_reset(self) -> None:
+        with mock.patch("time.monotonic", return_value=100):
+            self.predictor.update(self.route, headers(1, 0, 5))
+        with mock.patch("time.monotonic", return_value=105):
+            self.assertEqual(self.predictor.acquire(self.route), 0)
+            # the reset time is unknown until the next response, so an exhausted bucket is not predicted
+            self.assertEqual(self.predictor.acquire(self.route), 0)
+        self.assertEqual(self.predictor.predicted, 0)
+
+    def test_major_parameters_are_separate_buckets(self) -> None:
+        other = Route("PATCH", "/channels/{channel_id}", channel_id=2)
+        self.predictor.update(self.route, headers(1, 0, 5))
+        self.assertGreater(self.predictor.acquire(self.route), 0)
+        self.assertEqual(self.predictor.acquire(other), 0)
+
+    def test_in_flight_tokens_are_kept_within_a_window(self) -> None:
+        with mock.patch("time.monotonic", return_value=100):
+            self.predictor.update(self.route, headers(5, 5, 5))
+            for _ in range(3):
+                self.predictor.acquire(self.route)
+            # a response of the first request still reports four tokens left
+            self.predictor.update(self.route, headers(5, 4, 5))
+        self.assertEqual(self.predictor.get(self.route).remaining, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import time
+import unittest
+from unittest import mock
+
+from src.core.retry import RetryPolicy
+
+
+class RetryPolicyTest(unittest.TestCase):
+    """
+    The backoff decisions of the retry policy.
+    """
+
+    def setUp(self) -> None:
+        self.policy = RetryPolicy(max_attempts=4, base_delay=1, max_delay=5, max_elapsed=60)
+
+    def test_delay_is_jittered_below_the_ceiling(self) -> None:
+        for attempt, ceiling in ((0, 1), (1, 2), (2, 4), (3, 5), (10, 5)):
+            with self.subTest(attempt=attempt):
+                with mock.patch("random.uniform", side_effect=lambda a, b: b):
+                    self.assertEqual(self.policy.delay(attempt), ceiling)
+                self.assertTrue(all(0 <= self.policy.delay(attempt) <= ceiling for _ in range(100)))
+
+    def test_delay_honours_retry_after(self) -> None:
+        with mock.patch("random.uniform", return_value=0.5):
+            self.assertEqual(self.policy.delay(0, 3), 3)
+            self.assertEqual(self.policy.delay(0, 0.1), 0.5)
+
+    def test_backoff_gives_up_after_max_attempts(self) -> None:
+        started_at = time.monotonic()
+        self.assertIsNotNone(self.policy.backoff(0, started_at))
+        self.assertIsNotNone(self.policy.backoff(2, started_at))
+        self.assertIsNone(self.policy.backoff(3, started_at))
+        self.assertEqual(self.policy.stats, {"retries": 2, "failures": 1})
+
+    def test_backoff_gives_up_past_max_elapsed(self) -> None:
+        self.assertIsNone(self.policy.backoff(0, time.monotonic() - 60))
+        self.assertIsNone(self.policy.backoff(0, time.monotonic(), retry_after=61))
+        self.assertEqual(self.policy.failures, 2)
+
+    def test_parse_retry_after(self) -> None:
+        self.assertEqual(RetryPolicy.parse_retry_after("1.5"), 1.5)
+        self.assertEqual(RetryPolicy.parse_retry_after("-1"), 0)
+        self.assertIsNone(RetryPolicy.parse_retry_after(None))
+        self.assertIsNone(RetryPolicy.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"))
+
+
+if __name__ == "__main__":
+    unittest.main()
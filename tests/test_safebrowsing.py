@@ -0,0 +1,193 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import base64
+import hashlib
+import tempfile
+import unittest
+from typing import List, Set
+
+import aiohttp
+from aiohttp import web
+
+from src.utils.safebrowsing import LookupBatcher, ThreatListDatabase, canonicalize_url
+from src.utils.safebrowsing.database import THREAT_LISTS
+from src.utils.safebrowsing.hashing import url_hashes
+
+UNSAFE = canonicalize_url("http://malware.testing.google.test/testing/malware/")
+SAFE = canonicalize_url("https://example.com/")
+# the hash of the whole URL, its 4 bytes prefix is put into the malware list
+FULL_HASH = max(url_hashes(UNSAFE).items(), key=lambda i: len(i[1]))[0]
+PREFIX = FULL_HASH[:4]
+
+
+def list_update(threat_list: tuple, prefixes: List[bytes], response_type: str = "FULL_UPDATE", **kwargs) -> dict:
+    return {
+        "threatType": threat_list[0],
+        "platformType": threat_list[1],
+        "threatEntryType": threat_list[2],
+        "responseType": response_type,
+        "newClientState": base64.b64encode(f"{threat_list[0]}-{len(prefixes)}".encode()).decode(),
+        "checksum": {"sha256": base64.b64encode(hashlib.sha256(b"".join(sorted(prefixes))).digest()).decode()},
+        **kwargs,
+    }
+
+
+class StandIn:
+    """
+    A local server answering the Safe Browsing Update API with canned responses.
+    """
+
+    def __init__(self) -> None:
+        self.updates: List[dict] = []
+        self.requests: List[dict] = []
+        self.app = web.Application()
+        self.app.router.add_post("/v4/threatListUpdates:fetch", self.fetch)
+        self.app.router.add_post("/v4/fullHashes:find", self.find)
+
+    async def fetch(self, request: web.Request) -> web.Response:
+        self.requests.append(await request.json())
+        return web.json_response({"listUpdateResponses": self.updates.pop(0), "minimumWaitDuration": "600s"})
+
+    async def find(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.requests.append(body)
+        prefixes = [base64.b64decode(i["hash"]) for i in body["threatInfo"]["threatEntries"]]
+        matches = [
+            {
+                "threatType": "MALWARE",
+                "platformType": "ANY_PLATFORM",
+                "threatEntryType": "URL",
+                "threat": {"hash": base64.b64encode(FULL_HASH).decode()},
+                "cacheDuration": "300s",
+            }
+            for i in prefixes
+            if FULL_HASH.startswith(i)
+        ]
+        return web.json_response({"matches": matches, "negativeCacheDuration": "300s"})
+
+
+class ThreatListDatabaseTest(unittest.IsolatedAsyncioTestCase):
+    """
+    The update and lookup protocol of the local threat lists.
+    """
+
+    async def asyncSetUp(self) -> None:
+        self.server = StandIn()
+        self.runner = web.AppRunner(self.server.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.session = aiohttp.ClientSession()
+        self.database = ThreatListDatabase(
+            self.directory.name,
+            self.session,
+            "key",
+            "test",
+            api_url=f"http://127.0.0.1:{self.runner.addresses[0][1]}/v4",
+        )
+        self.database.load()
+
+    async def asyncTearDown(self) -> None:
+        self.database.close()
+        await self.session.close()
+        await self.runner.cleanup()
+        self.directory.cleanup()
+
+    async def full_update(self) -> float:
+        self.server.updates.append([list_update(i, [PREFIX] if i[0] == "MALWARE" else []) for i in THREAT_LISTS])
+        for update in self.server.updates[-1]:
+            if update["threatType"] == "MALWARE":
+                update["additions"] = [
+                    {
+                        "compressionType": "RAW",
+                        "rawHashes": {"prefixSize": 4, "rawHashes": base64.b64encode(PREFIX).decode()},
+                    }
+                ]
+        return await self.database.update()
+
+    async def test_update_and_lookup(self) -> None:
+        self.assertFalse(self.database.ready)
+        self.assertEqual(await self.full_update(), 600)
+        self.assertTrue(self.database.ready)
+        self.assertEqual(self.database.candidates(UNSAFE), {FULL_HASH: PREFIX})
+        self.assertEqual(self.database.candidates(SAFE), {})
+
+        self.assertEqual(await self.database.find([UNSAFE, SAFE]), {UNSAFE})
+        # only the matching prefix is sent, and the full hashes are cached afterwards
+        self.assertEqual(
+            self.server.requests[-1]["threatInfo"]["threatEntries"], [{"hash": base64.b64encode(PREFIX).decode()}]
+        )
+        self.assertEqual(await self.database.find([UNSAFE]), {UNSAFE})
+        self.assertEqual(len(self.server.requests), 2)
+
+    async def test_partial_update_removes_prefixes(self) -> None:
+        await self.full_update()
+        self.assertEqual(self.database.candidates(UNSAFE), {FULL_HASH: PREFIX})
+        self.server.updates.append(
+            [
+                list_update(i, [], "PARTIAL_UPDATE", removals=[{"rawIndices": {"indices": [0]}}])
+                for i in THREAT_LISTS
+                if i[0] == "MALWARE"
+            ]
+        )
+        await self.database.update()
+        self.assertEqual(self.database.candidates(UNSAFE), {})
+        self.assertEqual(await self.database.find([UNSAFE]), set())
+
+    async def test_checksum_mismatch(self) -> None:
+        update = list_update(THREAT_LISTS[0], [PREFIX])
+        self.server.updates.append([update])
+        with self.assertRaises(ValueError):
+            await self.database.update()
+        self.assertNotIn(THREAT_LISTS[0], self.database.states)
+
+
+class LookupBatcherTest(unittest.IsolatedAsyncioTestCase):
+    """
+    The sharing of batched lookups between callers.
+    """
+
+    async def asyncSetUp(self) -> None:
+        self.batches = []
+
+        async def fetch(urls: List[str]) -> Set[str]:
+            self.batches.append(sorted(urls))
+            await asyncio.sleep(0.01)
+            return {i for i in urls if "bad" in i}
+
+        self.batcher = LookupBatcher(fetch, window=0.01)
+
+    async def test_lookups_are_batched(self) -> None:
+        results = await asyncio.gather(self.batcher.lookup(["a", "bad"]), self.batcher.lookup(["bad", "b"]))
+        self.assertEqual(results, [{"bad"}, {"bad"}])
+        self.assertEqual(self.batches, [["a", "b", "bad"]])
+
+    async def test_cancelled_lookup_keeps_shared_urls(self) -> None:
+        first = asyncio.create_task(self.batcher.lookup(["bad"]))
+        second = asyncio.create_task(self.batcher.lookup(["bad"]))
+        await asyncio.sleep(0)
+        first.cancel()
+        self.assertEqual(await second, {"bad"})
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+
+
+if __name__ == "__main__":
+    unittest.main()
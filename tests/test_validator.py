@@ -0,0 +1,64 @@
+"""
+Copyright (C) 2024  猫戸シン
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+from src.utils.validator import Validator
+
+TOKEN = "MTIzNDU2Nzg5MDEyMzQ1Njc4.GaBcDe.abcdefghijklmnopqrstuvwxyz0123"
+
+
+class ScanTest(unittest.TestCase):
+    """
+    The single-pass scan of messages for URLs and tokens.
+    """
+
+    def scan(self, text: str) -> list:
+        return [(i.kind, i.value) for i in Validator.scan(text)]
+
+    def test_plain_text(self) -> None:
+        self.assertEqual(self.scan("早安"), [])
+        self.assertEqual(self.scan("ok... 那就這樣吧... 明天見" * 5), [])
+
+    def test_url_and_token(self) -> None:
+        self.assertEqual(
+            self.scan(f"看這個 https://example.com/a?b=1 還有 {TOKEN}"),
+            [("url", "https://example.com/a?b=1"), ("token", TOKEN)],
+        )
+
+    def test_token_inside_url(self) -> None:
+        self.assertEqual(
+            self.scan(f"https://example.com/?t={TOKEN}"),
+            [("url", f"https://example.com/?t={TOKEN}"), ("token", TOKEN)],
+        )
+
+    def test_url_glued_to_token(self) -> None:
+        for scheme in ("http", "https"):
+            with self.subTest(scheme=scheme):
+                self.assertEqual(
+                    self.scan(f"{TOKEN}{scheme}://evil.example/x"),
+                    [("token", TOKEN), ("url", f"{scheme}://evil.example/x")],
+                )
+
+    def test_token_ending_with_h(self) -> None:
+        self.assertEqual(
+            self.scan(f"{TOKEN}hhttp http://a.b/c"), [("token", f"{TOKEN}hhttp"), ("url", "http://a.b/c")]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()